@@ -0,0 +1,217 @@
+import gc
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from itertools import groupby
+from json import dumps, loads
+from random import Random
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+
+from bulk_model import BulkModel
+from event_model import EventModel
+from extra_types import Points
+from generations import Task, build_swarm, all_strategies
+from model import Model, CheckLevel
+from strategies import Strategy
+from swarm import Swarm
+from vectorized_model import VectorizedModel
+
+"""
+Repeatable timings of the simulation core.
+
+Every case runs one strategy on one swarm size, peer_size and up/down budget for a few iterations, from a fixed
+seed and with the invariant checks off. A case reports
+    setup           building the swarm and running its first iteration, which connects every client
+    per_iteration   median time of the iterations after the first, the best of `repeats` runs
+    peak_mb         peak traced memory of a separate run, tracemalloc slows everything down so it isn't timed
+Scaling exponents are fitted per strategy, peer_size and budget as the slope of log(per_iteration) against
+log(swarm size). Baselines are JSON files keyed by case, and --check fails when a case tracked by the baseline got
+slower or bigger by more than the thresholds. Timings only compare between runs on the same machine.
+"""
+
+BASELINE = './benchmark_baseline.json'
+
+MODELS: Dict[str, Type[Model]] = {'exact': Model, 'vectorized': VectorizedModel, 'bulk': BulkModel,
+                                  'event': EventModel}
+
+# Fraction of the swarm that starts as free riders
+FREE_RIDERS = .2
+
+Case = Tuple[Type[Strategy], int, int, int, int]
+
+
+def case_name(case: Case) -> str:
+    strategy, clients, peer_size, max_up, max_down = case
+    return f"{strategy.__name__}/{clients}/{peer_size}/{max_up}/{max_down}"
+
+
+def case_task(case: Case, iterations: int) -> Task:
+    strategy, clients, peer_size, max_up, max_down = case
+    bad = int(clients * FREE_RIDERS)
+    return strategy, iterations, clients - bad, bad, peer_size, Points(max_up), Points(max_down)
+
+
+def run_case(case: Case, model: Type[Model], iterations: int, seed: int) -> List[float]:
+    """ Seconds spent on every iteration, the first one includes building the swarm """
+    start = perf_counter()
+    swarm = build_swarm(case_task(case, iterations), Swarm(rng=Random(seed)))
+    times = []
+    for states in model.run(swarm, iterations, CheckLevel.OFF):
+        # the states are produced lazily, consume them like a writer would
+        list(states)
+        now = perf_counter()
+        times.append(now - start)
+        start = now
+    return times
+
+
+def measure(case: Case, model: Type[Model], iterations: int, repeats: int, seed: int) -> Dict[str, float]:
+    runs = []
+    for _ in range(repeats):
+        gc.collect()
+        runs.append(run_case(case, model, iterations, seed))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_case(case, model, iterations, seed)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'setup': min(x[0] for x in runs),
+        'per_iteration': min(float(np.median(x[1:])) if len(x) > 1 else x[0] for x in runs),
+        'peak_mb': peak / 2 ** 20,
+    }
+
+
+def scaling_exponents(results: Dict[str, Dict[str, float]]) -> Dict[str, float]:
+    """ Slope of log(per_iteration) over log(swarm size), for every strategy/peer_size/budget measured at 2+ sizes """
+    def group(name: str) -> str:
+        strategy, _, rest = name.split('/', 2)
+        return f"{strategy}/*/{rest}"
+
+    exponents = {}
+    for key, names in groupby(sorted(results, key=group), key=group):
+        names = list(names)
+        if len({x.split('/')[1] for x in names}) < 2:
+            continue
+        sizes = np.log([int(x.split('/')[1]) for x in names])
+        times = np.log([results[x]['per_iteration'] for x in names])
+        exponents[key] = float(np.polyfit(sizes, times, 1)[0])
+    return exponents
+
+
+def regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                time_threshold: float, memory_threshold: float, min_seconds: float = 0.) -> List[str]:
+    """
+    What got worse than the baseline allows, for every case the baseline tracks. Timings that moved by less than
+    min_seconds are left alone, the smallest cases are mostly noise.
+    """
+    found = []
+    for name, before in sorted(baseline.items()):
+        now = results.get(name)
+        if now is None:
+            found.append(f"{name} did not run")
+            continue
+        for metric, threshold, slack in (('per_iteration', time_threshold, min_seconds),
+                                         ('setup', time_threshold, min_seconds),
+                                         ('peak_mb', memory_threshold, 0.)):
+            if now[metric] > before[metric] * (1 + threshold) and now[metric] - before[metric] > slack:
+                found.append(f"{name} {metric} {before[metric]:.4g} -> {now[metric]:.4g} "
+                             f"(+{now[metric] / before[metric] - 1:.0%})")
+    return found
+
+
+def cases(strategies: Iterable[Type[Strategy]], sizes: Sequence[int], peer_sizes: Sequence[int],
+          budgets: Sequence[Tuple[int, int]]) -> List[Case]:
+    return [(strategy, clients, peer_size, max_up, max_down)
+            for strategy in strategies
+            for peer_size in peer_sizes
+            for max_up, max_down in budgets
+            for clients in sizes]
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--strategies', default=','.join(x.__name__ for x in all_strategies),
+                        help="comma separated strategies to benchmark")
+    parser.add_argument('--sizes', default='100,1000,10000', help="comma separated swarm sizes")
+    parser.add_argument('--peer-sizes', default='3,10', help="comma separated peer sizes")
+    parser.add_argument('--budgets', default='10:10,100:100', help="comma separated max_up:max_down pairs")
+    parser.add_argument('--model', choices=list(MODELS), default='exact', help="how the content is exchanged")
+    parser.add_argument('--iterations', type=int, default=5, help="iterations per run, the first one is setup")
+    parser.add_argument('--repeats', type=int, default=3, help="timed runs per case, the fastest counts")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE, help="baseline file to save to or check against")
+    parser.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--check', action='store_true',
+                        help="exit with status 1 when a case in the baseline regressed beyond the thresholds")
+    parser.add_argument('--time-threshold', type=float, default=.25,
+                        help="allowed relative slowdown of a case before --check fails")
+    parser.add_argument('--min-seconds', type=float, default=.005,
+                        help="timings that moved by less than this never count as regressions")
+    parser.add_argument('--memory-threshold', type=float, default=.1,
+                        help="allowed relative growth of the peak memory of a case before --check fails")
+    args = parser.parse_args()
+
+    by_name = {x.__name__: x for x in all_strategies}
+    try:
+        selected = [by_name[x] for x in args.strategies.split(',')]
+    except KeyError as e:
+        parser.error(f"unknown strategy {e}, the strategies are {', '.join(by_name)}")
+    settings = {k: v for k, v in vars(args).items() if k in ('model', 'iterations', 'repeats', 'seed')}
+    budgets = [tuple(int(y) for y in x.split(':')) for x in args.budgets.split(',')]
+    todo = cases(selected, [int(x) for x in args.sizes.split(',')], [int(x) for x in args.peer_sizes.split(',')],
+                 budgets)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    print(f"{'case':45} {'setup s':>10} {'iteration s':>12} {'peak MB':>10}")
+    for case in todo:
+        name = case_name(case)
+        try:
+            results[name] = measure(case, MODELS[args.model], args.iterations, args.repeats, args.seed)
+        except Exception as e:
+            print(f"{name:45} failed: {e!r}")
+            continue
+        r = results[name]
+        print(f"{name:45} {r['setup']:10.4f} {r['per_iteration']:12.5f} {r['peak_mb']:10.1f}")
+
+    exponents = scaling_exponents(results)
+    if exponents:
+        print("\nper iteration time ~ size^k")
+        for key, k in exponents.items():
+            print(f"{key:45} k = {k:.2f}")
+
+    if args.check:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"\nno baseline at {args.baseline}, run with --save first")
+            sys.exit(1)
+        if baseline['settings'] != settings:
+            print(f"\nthe baseline was measured with {baseline['settings']}, not {settings}")
+            sys.exit(1)
+        # only the tracked cases this run was asked for, so a subset can be checked on its own
+        requested = {case_name(x) for x in todo}
+        tracked = {k: v for k, v in baseline['cases'].items() if k in requested}
+        found = regressions(results, tracked, args.time_threshold, args.memory_threshold, args.min_seconds)
+        print(f"\n{len(found)} regressions in {len(tracked)} tracked cases of {args.baseline}")
+        for x in found:
+            print(f"  {x}")
+        if found:
+            sys.exit(1)
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            f.write(dumps({'settings': settings, 'cases': results, 'exponents': exponents}, indent=1))
+        print(f"\nsaved {len(results)} cases to {args.baseline}")
@@ -0,0 +1,107 @@
+from random import Random
+from typing import Sequence
+
+import numpy as np
+
+from client import Client
+from model import Model
+from vectorized_model import willing_edges, apply_transfers
+
+
+def spread(totals: np.ndarray, groups: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Split totals[g] as evenly as possible over the members of group g, the units that don't divide evenly going
+    to members picked at random. groups has one entry per member, members of a group do not need to be adjacent.
+    """
+    n = len(totals)
+    sizes = np.bincount(groups, minlength=n)
+    base = totals[groups] // sizes[groups]
+    extra = totals[groups] % sizes[groups]
+    return base + (random_rank(groups, rng) < extra)
+
+
+def random_rank(groups: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """ A random permutation of 0..size-1 within every group, returned in the original order """
+    if not groups.size:
+        return groups
+    order = np.lexsort((rng.random(groups.size), groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    rank = np.empty(groups.size, dtype=np.int64)
+    rank[order] = np.arange(groups.size) - np.repeat(starts, np.diff(np.r_[starts, groups.size]))
+    return rank
+
+
+def fair_share(requests: np.ndarray, supply: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Max-min fair split of supply units over requests: everybody gets min(request, level) for the highest level
+    supply covers, and the units left over go one each to requests above the level, picked at random.
+    """
+    if requests.sum() <= supply:
+        return requests.copy()
+    order = np.argsort(requests, kind='stable')
+    sorted_requests = requests[order]
+    m = len(requests)
+    below = np.r_[0, np.cumsum(sorted_requests)[:-1]]
+    # the first request that can't be granted in full when all the ones from there on get as much as it asks
+    t = int(np.flatnonzero(below + sorted_requests * (m - np.arange(m)) >= supply)[0])
+    level = (supply - below[t]) // (m - t)
+    grants = np.minimum(requests, level)
+    leftover = supply - grants.sum()
+    if leftover:
+        above = np.flatnonzero(requests > level)
+        grants[rng.choice(above, int(leftover), replace=False)] += 1
+    return grants
+
+
+class BulkModel(Model):
+    """
+    Same simulation as Model, with many passes of the exchange resolved at once in closed form per agent-peer pair.
+
+    In every pass of Model.exchange each agent that still wants content gets one unit from one of its willing
+    peers with upload left, picked at random. So over p passes an agent gets p units spread evenly over those
+    peers, and a peer gives away p times its share of the askers. Every epoch here runs as many passes as it
+    takes for the first agent to be satisfied or the first peer to run out, splits each agent's p units over its
+    peers with the odd units going to peers picked at random, and lets peers that were asked for more than
+    they have split their upload max-min fairly. Epochs repeat until nobody can get any more, which takes a
+    few per agent at most, however large max_down is.
+    """
+
+    @staticmethod
+    def exchange(all_agents: Sequence[Client], rng: Random) -> None:
+        np_rng = np.random.default_rng(rng.getrandbits(64))
+        receivers, givers = willing_edges(all_agents)
+
+        n = len(all_agents)
+        up = np.array([x.upload_remaining for x in all_agents], dtype=np.int64)
+        down_left = np.array([x.max_down - x.amount_acquired for x in all_agents], dtype=np.int64)
+        received = np.zeros(len(receivers), dtype=np.int64)
+
+        while True:
+            eligible = np.flatnonzero((down_left[receivers] > 0) & (up[givers] > 0))
+            if not eligible.size:
+                break
+            asking, giving = receivers[eligible], givers[eligible]
+
+            # Every pass each active agent asks one of its k eligible peers, so each of them 1/k of the time
+            k = np.bincount(asking, minlength=n)
+            load = np.bincount(giving, weights=1 / k[asking], minlength=n)
+            active = np.flatnonzero(k)
+            loaded = np.flatnonzero(load)
+            passes = max(1, int(min(down_left[active].min(), (up[loaded] / load[loaded]).min())))
+
+            requests = spread(np.minimum(down_left, passes), asking, np_rng)
+            asked = np.bincount(giving, weights=requests, minlength=n).astype(np.int64)
+            grants = requests.copy()
+            # Peers asked for more than they have left split it fairly, the others grant everything
+            by_giver = np.argsort(giving, kind='stable')
+            bounds = np.searchsorted(giving[by_giver], np.arange(n + 1))
+            for giver in np.flatnonzero(asked > up):
+                mine = by_giver[bounds[giver]:bounds[giver + 1]]
+                grants[mine] = fair_share(requests[mine], int(up[giver]), np_rng)
+
+            up -= np.bincount(giving, weights=grants, minlength=n).astype(np.int64)
+            down_left -= np.bincount(asking, weights=grants, minlength=n).astype(np.int64)
+            received[eligible] += grants
+
+        apply_transfers(all_agents, receivers, givers, received)
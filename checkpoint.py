@@ -0,0 +1,102 @@
+import gzip
+import os
+import pickle
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+from client import Client
+from convergence import ConvergenceMonitor
+from events import EventRecorder
+from swarm import Swarm
+
+"""
+Snapshots of a running simulation, to resume it or to fork variants off it.
+
+A snapshot is taken between two iterations and holds everything the next one depends on: the swarm with its
+generator, peer graph and saturation index, every client with its budgets and strategy, the order Model.run goes
+through the clients in and the convergence monitor. They are pickled and gzipped.
+
+Clients point at each other through their strategies' histories, deep enough to overflow the recursion limit when
+pickled as they come. So every client is pickled by reference first and the clients' own state is written as a
+flat list next to the rest. The event recorder is left out too, it owns an open file, and whoever loads the
+snapshot can hand a new one in.
+"""
+
+SUFFIX = '.ckpt'
+
+
+@dataclass
+class Snapshot:
+    # the iteration the run continues with
+    iteration: int
+    swarm: Swarm
+    # in the order Model.run goes through them
+    agents: List[Client]
+    convergence: Optional[ConvergenceMonitor] = None
+    # whatever the caller needs to pick its own bookkeeping up again
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file: BinaryIO, agents: List[Client]):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._index = {id(x): i for i, x in enumerate(agents)}
+
+    def persistent_id(self, obj: Any) -> Any:
+        if isinstance(obj, Client):
+            # clients are hashed by id as soon as they land in a set or a dict, before their state is loaded
+            return 'client', self._index[id(obj)], obj.id
+        if isinstance(obj, EventRecorder):
+            return 'recorder', None, None
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file: BinaryIO, recorder: Optional[EventRecorder]):
+        super().__init__(file)
+        self.recorder = recorder
+        self.clients: Dict[int, Client] = {}
+
+    def persistent_load(self, pid: Any) -> Any:
+        kind, i, client_id = pid
+        if kind == 'recorder':
+            return self.recorder
+        if i not in self.clients:
+            self.clients[i] = Client.__new__(Client)
+            self.clients[i]._id = client_id
+        return self.clients[i]
+
+
+def save_snapshot(snapshot: Snapshot, path: str) -> None:
+    """ Written to a temporary file first, so a crash never leaves a half written snapshot behind """
+    states = [tuple(getattr(x, k) for k in Client.__slots__) for x in snapshot.agents]
+    tmp = path + '.tmp'
+    with gzip.open(tmp, 'wb', compresslevel=1) as f:
+        _Pickler(f, snapshot.agents).dump((snapshot, states))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path: str, recorder: Optional[EventRecorder] = None) -> Snapshot:
+    with gzip.open(path, 'rb') as f:
+        unpickler = _Unpickler(f, recorder)
+        snapshot, states = unpickler.load()
+    for i, state in enumerate(states):
+        client = unpickler.clients.setdefault(i, Client.__new__(Client))
+        for k, v in zip(Client.__slots__, state):
+            setattr(client, k, v)
+    return snapshot
+
+
+class Checkpointer:
+    """ Model.run's checkpoint callback, keeps the latest snapshot taken every `every` iterations at path """
+
+    def __init__(self, path: str, every: int, extra: Optional[Callable[[], Dict[str, Any]]] = None):
+        self.path = path
+        self.every = every
+        self._extra = extra
+
+    def __call__(self, snapshot: Snapshot) -> None:
+        if self.every > 0 and snapshot.iteration % self.every == 0:
+            if self._extra is not None:
+                snapshot.extra = self._extra()
+            save_snapshot(snapshot, self.path)
@@ -1,22 +1,15 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from itertools import count
-from typing import Dict, Sequence, TYPE_CHECKING, Type, Any, List
+from typing import Sequence, TYPE_CHECKING, Type, Any, List, Iterable, Optional
 
-from extra_types import Points, no_points
+from extra_types import Points
+from profiler import timed, PRE_GENERATE, GENERATE_NEW_PEERS, STRATEGY_AFTER_RESET
 from strategies import Strategy
 
 if TYPE_CHECKING:
     from swarm import Swarm
 
-_counter = count(0)
-
-def empty_peers_dict(peers):
-    return {
-        x: no_points for x in peers
-    }
-
 @dataclass(frozen=True)
 class Result:
     amount_acquired: int
@@ -39,6 +32,9 @@ class Result:
 
 
 class Client:
+    __slots__ = ('_strategy', '_swarm', '_graph', '_slot', '_id', '_max_up', '_willing_to_give', '_max_down',
+                 '_current_up', 'peer_size', '_persisted')
+
     def __init__(self,
                  strat: Type[Strategy],
                  up: Points,
@@ -48,12 +44,14 @@ class Client:
                  iterations: int
                  ):
         self._strategy = strat(swarm, self, iterations)
-        self._id = _counter.__next__()
+        self._swarm = swarm
+        self._graph = swarm.peer_graph
+        self._slot = self._graph.add_node(self)
+        self._id = swarm.next_id()
         self._max_up = up
         self._willing_to_give = up
         self._max_down = down
         self._current_up = up
-        self._peers: Dict[Client, Points] = {}
         self.peer_size = peer_size
         self._persisted = None
 
@@ -61,38 +59,99 @@ class Client:
     def id(self) -> int:
         return self._id
 
+    @property
+    def max_up(self) -> Points:
+        return self._max_up
+
+    @property
+    def max_down(self) -> Points:
+        return self._max_down
+
+    def set_limits(self, up: Optional[Points] = None, down: Optional[Points] = None) -> None:
+        """
+        New budgets for a run forked off a snapshot. The exchange reads max_down directly, so a new one caps the
+        very next iteration. max_up only comes in through reset_values, as what the upload is topped back up to,
+        so the next iteration still uploads what the last reset_values left and the new one counts after that.
+        """
+        if up is not None:
+            self._max_up = up
+        if down is not None:
+            self._max_down = down
+
+    @property
+    def amount_acquired(self) -> Points:
+        return self._current_down
+
+    @property
+    def upload_remaining(self) -> Points:
+        return self._current_up
+
+    @property
+    def slot(self) -> int:
+        """ Index of this client in the swarm's PeerGraph """
+        return self._slot
+
+    @property
+    def in_degree(self) -> int:
+        """ Number of clients that have this one as a peer """
+        return self._graph.in_degree(self._slot)
+
+    @property
+    def inbound_peers(self) -> Sequence[Client]:
+        """ The clients that have this one as a peer """
+        return self._graph.inbound(self._slot)
+
     @property
     def is_saturated(self):
-        return len(self.peers) >= self.peer_size
+        return self._graph.degree(self._slot) >= self.peer_size
 
     @property
     def peers(self) -> Sequence[Client]:
-        return list(self._peers.keys())
+        return self._graph.neighbors(self._slot)
+
+    def has_peer(self, peer: Client) -> bool:
+        return self._graph.has_edge(self._slot, peer._slot)
 
     def add_peer(self, peer: Client) -> None:
-        print(f"connecting {self} --> {peer}")
-        assert peer not in self.peers
-        self._peers[peer] = no_points
+        self._graph.add_edge(self._slot, peer._slot)
+        self._swarm.update_saturation(self)
 
     def remove_peer(self, peer: Client) -> None:
-        print(f"removing {self} --> {peer}")
-        del self._peers[peer]
+        self._graph.remove_edge(self._slot, peer._slot)
+        self._swarm.update_saturation(self)
+
+    def connect(self, peer: Client) -> None:
+        """ Add the connection in both directions """
+        self._graph.connect(self._slot, peer._slot)
+        self._swarm.update_saturation(self)
+        self._swarm.update_saturation(peer)
+
+    def disconnect(self, peer: Client) -> None:
+        """ Remove the connection in both directions """
+        self._graph.disconnect(self._slot, peer._slot)
+        self._swarm.update_saturation(self)
+        self._swarm.update_saturation(peer)
+
+    def _set_peers(self, peers: Iterable[Client]) -> None:
+        self._graph.set_neighbors(self._slot, (x._slot for x in peers))
+        self._swarm.update_saturation(self)
 
     @property
     def _is_free_rider(self) -> bool:
         return self._willing_to_give < (self._max_down // 2)
 
     def init_peers(self) -> None:
-        self._peers = empty_peers_dict(self._strategy.init_peers(self.peer_size))
+        self._set_peers(self._strategy.init_peers(self.peer_size))
 
     @property
     def _current_down(self) -> Points:
-        return sum(self._peers.values())
+        return self._graph.total_received(self._slot)
 
     def before_reset(self):
-        self._persisted = dict(self._peers.items())
+        self._persisted = self._graph.contributions(self._slot)
 
     def reset_values(self):
+        was_free_rider = self._is_free_rider
         # if happy for this round reset to max
         if self._current_down > int(.65 * float(self._max_down)):
             self._willing_to_give = self._max_up
@@ -102,34 +161,47 @@ class Client:
 
         self._current_up = self._willing_to_give
 
+        recorder = self._swarm.recorder
+        if recorder is not None and self._is_free_rider != was_free_rider:
+            recorder.free_rider(self._id, not was_free_rider)
+
     def reset(self, current_iteration: int) -> None:
-        new_neighbors, removed_people = self._strategy.pre_generate(self._persisted, current_iteration)
-        new_peers = list(self._strategy.generate_new_peers(self._persisted, current_iteration, new_neighbors, removed_people))
-        print(f"Got new peers for {self}: ", new_peers)
-        self._peers = empty_peers_dict(new_peers)
+        profiler = self._swarm.profiler
+        new_neighbors, removed_people = timed(profiler, PRE_GENERATE, self._strategy.pre_generate, self._persisted,
+                                              current_iteration)
+        new_peers = timed(profiler, GENERATE_NEW_PEERS, lambda: list(
+            self._strategy.generate_new_peers(self._persisted, current_iteration, new_neighbors, removed_people)))
+        self._set_peers(new_peers)
 
     def after_reset(self, current_iteration: int):
         # clean up dangling connections
         for peer in self.peers:
-            if self not in peer.peers:
+            if not peer.has_peer(self):
                 self.remove_peer(peer)
-        self._strategy.after_reset(current_iteration)
+        timed(self._swarm.profiler, STRATEGY_AFTER_RESET, self._strategy.after_reset, current_iteration)
+
 
+    def willing_to_give_to(self, client: Client) -> bool:
+        return self._strategy.willing_to_give_to(client)
 
     def ask_for_content(self, give_to: Client) -> bool:
         """ Returns whether or not content was granted """
-        if self._strategy.willing_to_give_to(give_to):
+        if self.willing_to_give_to(give_to):
             if self._current_up > 0:
                 self._current_up -= 1
                 return True
         return False
 
+    def spend_upload(self, amount: Points) -> None:
+        """ Use up upload capacity that was granted outside of ask_for_content """
+        self._current_up -= amount
+
     def wants_content(self) -> bool:
         """ Returns whether or not client wants content"""
         return self._current_down < self._max_down
 
-    def give_content(self, from_: Client) -> None:
-        self._peers[from_] += 1
+    def give_content(self, from_: Client, amount: Points = Points(1)) -> None:
+        self._graph.add_contribution(self._slot, from_._slot, amount)
 
     def get_state(self) -> Result:
         return Result(
@@ -0,0 +1,145 @@
+from array import array
+from collections import defaultdict
+from typing import Dict, Generic, Iterator, List, Set, TypeVar
+
+T = TypeVar('T')
+
+
+class ContributionHistory(Generic[T]):
+    """
+    What every peer a client has unchoked gave it, for the last `window` iterations only.
+
+    Each peer gets a row of `window` slots in one flat array, used as a ring buffer indexed by iteration.
+    Besides the window, every row keeps the iteration the peer was (last) unchoked in, the number of
+    non zero contributions ever recorded and the total recorded since it was unchoked, so memory no
+    longer grows with the number of iterations.
+    """
+
+    def __init__(self, window: int):
+        if window < 1:
+            raise ValueError("the window has to hold at least the current iteration")
+        self.window = window
+        self._rows: Dict[T, int] = {}
+        self._values = array('q')
+        self._added = array('q')
+        # the latest iteration recorded for a peer, the window ends there
+        self._last = array('q')
+        self._nonzero = array('q')
+        self._since_added = array('q')
+
+    def __contains__(self, peer: T) -> bool:
+        return peer in self._rows
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, peer: T, iteration: int) -> None:
+        """ Start keeping the contributions of peer, unchoked in iteration """
+        self._rows[peer] = len(self._added)
+        self._values.extend(0 for _ in range(self.window))
+        self._added.append(iteration)
+        self._last.append(iteration - 1)
+        self._nonzero.append(0)
+        self._since_added.append(0)
+
+    def row(self, peer: T) -> int:
+        """ Rows are handed out in the order peers were added """
+        return self._rows[peer]
+
+    def added(self, peer: T) -> int:
+        return self._added[self._rows[peer]]
+
+    def restart(self, peer: T, iteration: int) -> None:
+        """ peer was unchoked again, the total since it was added starts over from iteration """
+        row = self._rows[peer]
+        self._added[row] = iteration
+        self._since_added[row] = sum(self.recent(peer, iteration, self._last[row] + 1))
+
+    def record(self, peer: T, iteration: int, amount: int) -> None:
+        """ Contributions are recorded in increasing iteration order, the latest one can be overwritten """
+        row = self._rows[peer]
+        last = self._last[row]
+        if iteration < last:
+            raise ValueError(f"iteration {iteration} is older than the last one recorded, {last}")
+        start = row * self.window
+        if iteration == last:
+            old = self._values[start + iteration % self.window]
+        else:
+            old = 0
+            # iterations that were skipped contributed nothing
+            for i in range(max(last + 1, iteration - self.window + 1), iteration):
+                self._values[start + i % self.window] = 0
+            self._last[row] = iteration
+        self._values[start + iteration % self.window] = amount
+        self._nonzero[row] += (amount != 0) - (old != 0)
+        if iteration >= self._added[row]:
+            self._since_added[row] += amount - old
+
+    def get(self, peer: T, iteration: int) -> int:
+        row = self._rows[peer]
+        last = self._last[row]
+        if iteration > last:
+            return 0
+        if iteration <= last - self.window:
+            raise IndexError(f"iteration {iteration} is no longer in the window of {self.window}")
+        return self._values[row * self.window + iteration % self.window]
+
+    def recent(self, peer: T, start: int, stop: int) -> List[int]:
+        """ Contributions of iterations start up to stop, like contributions[start:stop] used to be """
+        return [self.get(peer, i) for i in range(max(start, 0), stop)]
+
+    def nonzero(self, peer: T) -> int:
+        """ Iterations peer gave something in, over the whole run """
+        return self._nonzero[self._rows[peer]]
+
+    def since_added(self, peer: T) -> int:
+        """ Everything peer gave from the iteration it was last unchoked in """
+        return self._since_added[self._rows[peer]]
+
+
+class FrequentGivers(Generic[T]):
+    """
+    Peers that gave something in at least `times` of the `window` iterations before the current one.
+
+    Contributions are counted in when they are recorded and the window slides forward once per iteration,
+    so the work is proportional to the contributions in the window rather than to every peer ever seen.
+    """
+
+    def __init__(self, window: int, times: int):
+        self.window = window
+        self.times = times
+        # peers that gave something, by iteration, for the window and the iterations not in it yet
+        self._gave: Dict[int, Set[T]] = defaultdict(set)
+        self._counts: Dict[T, int] = defaultdict(int)
+        self._frequent: Set[T] = set()
+        # the window covers [self._end - window, self._end)
+        self._end = 0
+
+    def record(self, peer: T, iteration: int, amount: int) -> None:
+        if iteration < self._end:
+            raise ValueError(f"iteration {iteration} is already in the window")
+        # slide up to iteration first, so only the iterations that can still enter the window are buffered
+        self.at(iteration)
+        if amount != 0:
+            self._gave[iteration].add(peer)
+        elif iteration in self._gave:
+            self._gave[iteration].discard(peer)
+
+    def at(self, iteration: int) -> Set[T]:
+        """ The frequent givers for a choice made in iteration, the window only ever moves forward """
+        while self._end < iteration:
+            for peer in self._gave.get(self._end, ()):
+                self._counts[peer] += 1
+                if self._counts[peer] == self.times:
+                    self._frequent.add(peer)
+            for peer in self._gave.pop(self._end - self.window, ()):
+                self._counts[peer] -= 1
+                if self._counts[peer] == self.times - 1:
+                    self._frequent.discard(peer)
+                if not self._counts[peer]:
+                    del self._counts[peer]
+            self._end += 1
+        return self._frequent
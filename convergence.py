@@ -0,0 +1,95 @@
+from abc import ABC, abstractmethod
+from typing import Sequence, Optional, Dict, Any, Tuple
+
+from client import Result
+
+
+class StopCriterion(ABC):
+    reason: str
+
+    @abstractmethod
+    def update(self, states: Sequence[Result]) -> bool:
+        """ Called with every iteration's states, returns whether the run has converged """
+        raise NotImplementedError
+
+
+class ZeroTransfer(StopCriterion):
+    """ Nobody acquired anything. Nobody is willing to give after such a round, so nothing can change anymore """
+    reason = 'zero_transfer'
+
+    def update(self, states: Sequence[Result]) -> bool:
+        return sum(x.amount_acquired for x in states) == 0
+
+
+class _Unchanged(StopCriterion):
+    """ Some summary of the states stayed the same for `stable_for` iterations in a row """
+
+    def __init__(self, stable_for: int):
+        self._stable_for = stable_for
+        self._last = None
+        self._unchanged = 0
+
+    @abstractmethod
+    def summary(self, states: Sequence[Result]) -> Any:
+        raise NotImplementedError
+
+    def update(self, states: Sequence[Result]) -> bool:
+        current = self.summary(states)
+        if current == self._last:
+            self._unchanged += 1
+        else:
+            self._unchanged = 0
+        self._last = current
+        return self._unchanged >= self._stable_for
+
+
+class StablePopulation(_Unchanged):
+    reason = 'stable_population'
+
+    def summary(self, states: Sequence[Result]) -> int:
+        return sum(1 for x in states if x.free_rider)
+
+
+class StableTopology(_Unchanged):
+    reason = 'stable_topology'
+
+    def summary(self, states: Sequence[Result]) -> Tuple[Tuple[int, Tuple[int, ...]], ...]:
+        return tuple(sorted((x.id, tuple(sorted(x.peers))) for x in states))
+
+
+class ConvergenceMonitor:
+    """ Tells Model.run to stop as soon as any of its criteria is met, and remembers when and why """
+
+    def __init__(self, *criteria: StopCriterion):
+        self._criteria = criteria
+        self.stopped_at: Optional[int] = None
+        self.reason: Optional[str] = None
+
+    def update(self, iteration: int, states: Sequence[Result]) -> bool:
+        # every criterion sees every iteration, so their streaks stay correct
+        met = [x for x in self._criteria if x.update(states)]
+        if met:
+            self.stopped_at = iteration
+            self.reason = met[0].reason
+            return True
+        return False
+
+    def summary(self) -> Dict[str, Any]:
+        """ What to record in the run's metadata, nothing if it ran to the end """
+        if self.stopped_at is None:
+            return {}
+        return {'stopped_at': self.stopped_at, 'stop_reason': self.reason}
+
+
+CRITERIA = {
+    'zero': lambda stable_for: ZeroTransfer(),
+    'population': StablePopulation,
+    'topology': StableTopology,
+}
+
+
+def make_monitor(names: Sequence[str], stable_for: int) -> Optional[ConvergenceMonitor]:
+    """ Monitor for the criteria named in CRITERIA, None when there are none """
+    if not names:
+        return None
+    return ConvergenceMonitor(*(CRITERIA[x](stable_for) for x in names))
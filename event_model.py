@@ -0,0 +1,108 @@
+from heapq import heappush, heappop
+from itertools import count
+from random import Random
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from client import Client
+from model import Model, random_iteration
+from profiler import Profiler, timed, BEFORE_RESET, RESET, AFTER_RESET
+
+
+class EventQueue:
+    """ Actions run in time order, ties in random order with an rng and in the order they were scheduled without """
+
+    def __init__(self, rng: Optional[Random] = None):
+        self._heap: List[Tuple[float, float, int, Callable[..., None], Tuple[Any, ...]]] = []
+        self._seq = count()
+        self._rng = rng
+        self.now = 0.
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, time: float, action: Callable[..., None], *args: Any) -> None:
+        heappush(self._heap, (time, self._rng.random() if self._rng is not None else 0., next(self._seq), action, args))
+
+    def run(self) -> None:
+        """ Until no event is left, events can schedule more """
+        while self._heap:
+            self.now, _, _, action, args = heappop(self._heap)
+            action(*args)
+
+
+class EventModel(Model):
+    """
+    Same simulation as Model, with the exchange of every iteration run as timed events on a priority queue.
+
+    Every client uploads at its own rate and reaches the others with its own latency, a unit from peer to
+    agent takes latency(agent) + latency(peer) to get going and 1 / rate(peer) on the wire. Like in Model a
+    peer serves every agent that asks as long as it has upload left, the rate is per connection. An agent
+    that wants content requests a unit from one of its willing peers with upload left, picked at random like
+    Model does, and requests the next one once it arrived. With every rate equal and no latency that is
+    Model's passes again, each agent gets a unit per unit of time. An agent none of its
+    peers can serve, or that is satisfied, has no more events this iteration and costs nothing.
+    With round_length set, an iteration only lasts that long and transfers that would not finish in time
+    are not started, so slow peers give less. Without it an iteration lasts until no transfers are left.
+
+    At the end of an iteration the strategies make their choke/unchoke decisions as events at random times
+    past the boundary, all the before_reset ones before the resets and those before the after_resets.
+
+    Rates and latencies are drawn per client from its id and network_seed, so they do not use the
+    simulation's generator and stay the same when a run is resumed from a snapshot. Subclass to change them.
+    """
+
+    # units per unit of time, every client draws from this range
+    upload_rate: Tuple[float, float] = (1., 1.)
+    # time before a transfer starts, every client draws from this range
+    latency: Tuple[float, float] = (0., 0.)
+    round_length: Optional[float] = None
+    network_seed = 0
+
+    @classmethod
+    def link(cls, client: Client) -> Tuple[float, float]:
+        """ (upload rate, latency) of a client """
+        r = Random(cls.network_seed * 1_000_003 + client.id)
+        return r.uniform(*cls.upload_rate), r.uniform(*cls.latency)
+
+    @classmethod
+    def exchange(cls, all_agents: Sequence[Client], rng: Random) -> None:
+        links = {x: cls.link(x) for x in all_agents}
+        peers = {x: x.peers for x in all_agents}
+        wanted = {x: x.max_down - x.amount_acquired for x in all_agents}
+        # agents served at the same time go in random order, like the agents of one of Model's passes
+        events = EventQueue(rng)
+
+        def request(agent: Client) -> None:
+            for peer in random_iteration(peers[agent], rng):
+                if peer.upload_remaining <= 0:
+                    continue
+                rate, latency = links[peer]
+                done = events.now + links[agent][1] + latency + 1 / rate
+                if cls.round_length is not None and done > cls.round_length:
+                    continue
+                if peer.ask_for_content(agent):
+                    events.schedule(done, deliver, agent, peer)
+                    return
+            # none of the peers gave, the agent sits the rest of the iteration out
+
+        def deliver(agent: Client, peer: Client) -> None:
+            agent.give_content(peer)
+            wanted[agent] -= 1
+            if wanted[agent] > 0:
+                request(agent)
+
+        for agent in all_agents:
+            if wanted[agent] > 0:
+                events.schedule(0., request, agent)
+        events.run()
+
+    @staticmethod
+    def reconnect(all_agents: Sequence[Client], current_iteration: int, rng: Random,
+                  profiler: Optional[Profiler]) -> None:
+        c = current_iteration
+        for phase, action in ((BEFORE_RESET, lambda x: x.before_reset()), (RESET, lambda x: x.reset(c)),
+                              (AFTER_RESET, lambda x: x.after_reset(c))):
+            events = EventQueue(rng)
+            for x in all_agents:
+                events.schedule(rng.random(), action, x)
+            timed(profiler, phase, events.run)
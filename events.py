@@ -0,0 +1,185 @@
+from collections import defaultdict
+from enum import IntEnum
+from sys import argv
+from typing import Optional, Iterator, Dict, Set, Any, BinaryIO
+
+import numpy as np
+
+
+class EventKind(IntEnum):
+    ITERATION = 0
+    CONNECT = 1
+    DISCONNECT = 2
+    CHOKE = 3
+    UNCHOKE = 4
+    # b is 1 when client a became a free rider, 0 when it went back to giving
+    FREE_RIDER = 5
+
+
+EVENT_DTYPE = np.dtype([('kind', 'u1'), ('iteration', '<i4'), ('a', '<i4'), ('b', '<i4')])
+
+_MAGIC = b'P2PEVT1\0'
+
+
+class EventRecorder:
+    """
+    Records what happens to a swarm as fixed size binary records in a preallocated buffer.
+
+    Without a path the buffer is a ring that keeps the most recent `capacity` events. With a path, the buffer
+    is appended to the file every time it fills up and on close, so the whole run is kept.
+    Simulation code holds an Optional[EventRecorder] and skips recording entirely when it is None.
+    """
+
+    def __init__(self, capacity: int = 1 << 16, path: Optional[str] = None):
+        self._buffer = np.zeros(capacity, dtype=EVENT_DTYPE)
+        self._next = 0
+        self._wrapped = False
+        self._iteration = 0
+        self._file: Optional[BinaryIO] = None
+        if path is not None:
+            self._file = open(path, 'wb')
+            self._file.write(_MAGIC)
+
+    def record(self, kind: EventKind, a: int = -1, b: int = -1) -> None:
+        if self._next == len(self._buffer):
+            if self._file is not None:
+                self.flush()
+            else:
+                self._next = 0
+                self._wrapped = True
+        self._buffer[self._next] = (kind, self._iteration, a, b)
+        self._next += 1
+
+    def iteration(self, iteration: int) -> None:
+        self._iteration = iteration
+        self.record(EventKind.ITERATION)
+
+    def connect(self, a: int, b: int) -> None:
+        self.record(EventKind.CONNECT, a, b)
+
+    def disconnect(self, a: int, b: int) -> None:
+        self.record(EventKind.DISCONNECT, a, b)
+
+    def choke(self, a: int, b: int) -> None:
+        self.record(EventKind.CHOKE, a, b)
+
+    def unchoke(self, a: int, b: int) -> None:
+        self.record(EventKind.UNCHOKE, a, b)
+
+    def free_rider(self, a: int, is_free_rider: bool) -> None:
+        self.record(EventKind.FREE_RIDER, a, int(is_free_rider))
+
+    def events(self) -> np.ndarray:
+        """ Buffered events, oldest first """
+        if self._wrapped:
+            return np.concatenate((self._buffer[self._next:], self._buffer[:self._next]))
+        return self._buffer[:self._next].copy()
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.write(self._buffer[:self._next].tobytes())
+            self._file.flush()
+            self._next = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        # the file handle can't be pickled, keep only what is still buffered
+        state = dict(self.__dict__)
+        state['_file'] = None
+        return state
+
+
+def read_events(path: str) -> np.ndarray:
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not an event file")
+        return np.frombuffer(f.read(), dtype=EVENT_DTYPE)
+
+
+def format_events(events: np.ndarray) -> Iterator[str]:
+    """ Rebuild the human readable trace """
+    for kind, iteration, a, b in events.tolist():
+        if kind == EventKind.ITERATION:
+            yield f"Iteration {iteration}"
+        elif kind == EventKind.CONNECT:
+            yield f"connecting {a} --> {b}"
+        elif kind == EventKind.DISCONNECT:
+            yield f"removing {a} --> {b}"
+        elif kind == EventKind.CHOKE:
+            yield f"{a} choking {b}"
+        elif kind == EventKind.UNCHOKE:
+            yield f"{a} un_choking {b}"
+        elif kind == EventKind.FREE_RIDER:
+            yield f"{a} {'became' if b else 'is no longer'} a free rider"
+
+
+def to_peer_data(events: np.ndarray, strategy: str = 'replay') -> Dict[str, Any]:
+    """
+    Replay the topology into the same layout as a results file, one entry per client per iteration.
+
+    Only the fields the peer graph video needs are known from events, the amounts are left at 0.
+    """
+    peers: Dict[int, Set[int]] = defaultdict(set)
+    free_riders: Set[int] = set()
+    data = []
+
+    def snapshot(iteration):
+        for client in sorted(peers.keys() | free_riders):
+            data.append({
+                'amount_acquired': 0,
+                'amount_remaining': 0,
+                'willing_to_give': 0,
+                'free_rider': client in free_riders,
+                'id': client,
+                'iteration': iteration,
+                'peers': sorted(peers[client])
+            })
+
+    iterations = 0
+    for kind, iteration, a, b in events.tolist():
+        if kind == EventKind.ITERATION:
+            # the graph at the iteration boundary is the one content was exchanged over
+            snapshot(iteration)
+            iterations = iteration + 1
+        elif kind == EventKind.CONNECT:
+            peers[a].add(b)
+        elif kind == EventKind.DISCONNECT:
+            peers[a].discard(b)
+        elif kind == EventKind.FREE_RIDER:
+            if b:
+                free_riders.add(a)
+            else:
+                free_riders.discard(a)
+
+    return {
+        'metadata': {
+            'strategy': strategy,
+            'iterations': iterations,
+            # amounts are not known from events, these only keep the utility maths defined
+            'max_up': 1,
+            'max_down': 1
+        },
+        'data': data
+    }
+
+
+if __name__ == '__main__':
+    try:
+        cmd = argv[1]
+        path = argv[2]
+        if cmd == 'log':
+            for line in format_events(read_events(path)):
+                print(line)
+        elif cmd == 'vid':
+            from parse_data_file import render_peer_graph
+            from result_set import ResultSet
+            render_peer_graph(ResultSet.from_data(to_peer_data(read_events(path))), argv[3] if len(argv) == 4 else "all")
+        else:
+            print("valid commands are 'log' and 'vid'")
+    except IndexError:
+        print(f"usage: {argv[0]} log|vid path/to/events/file [iterations]")
@@ -0,0 +1,131 @@
+import os
+from multiprocessing.pool import Pool
+from random import Random
+from sys import argv
+from typing import Any, Dict, List, Optional, Tuple
+
+import strategies
+from checkpoint import Snapshot, load_snapshot, save_snapshot
+from extra_types import Points, no_points
+from generations import Task, build_swarm, SEED
+from model import Model, CheckLevel
+from results_io import ResultWriter, stream_results
+from swarm import Swarm
+from sweep_cache import task_seed
+
+"""
+Variants of one run that share its warm-up.
+
+`warm` runs a configuration for a number of iterations, writes them as a results file and snapshots the swarm
+right after. `fork` starts every variant from that snapshot, with other up/down budgets or peer sizes from then
+on, so the warm-up is simulated once however many variants there are. Every variant's results file starts with
+a copy of the warm-up's iterations, so it reads like any other run.
+"""
+
+# what a variant can change, and how its value is parsed
+VARIANT_FIELDS = {'max_up': int, 'max_down': int, 'peer_size': int}
+
+
+def warm(t: Task, warmup: int, snapshot_path: str) -> Snapshot:
+    """ Runs the first warmup iterations of t, the results go next to the snapshot """
+    strategy, iterations, num_good_clients, num_free_riders, peer_size, max_up, max_down = t
+    seed = task_seed(t, SEED)
+    swarm = build_swarm(t, Swarm(rng=Random(seed)))
+    metadata = {
+        'strategy': strategy.__name__,
+        'iterations': iterations,
+        'max_up': max_up,
+        'max_down': max_down,
+        'starting_good_clients': num_good_clients,
+        'starting_bad_clients': num_free_riders,
+        'peer_size': peer_size,
+        'seed': seed,
+    }
+    results_path = os.path.splitext(snapshot_path)[0] + '.jsonl'
+    taken: List[Snapshot] = []
+
+    def keep(snapshot: Snapshot) -> None:
+        if snapshot.iteration == warmup:
+            taken.append(snapshot)
+
+    with ResultWriter(results_path, metadata) as writer:
+        for iteration, states in enumerate(Model.run(swarm, warmup, CheckLevel.OFF, checkpoint=keep)):
+            writer.write_iteration(iteration, states)
+    snapshot = taken[0]
+    snapshot.extra = {'metadata': metadata, 'results': results_path}
+    save_snapshot(snapshot, snapshot_path)
+    return snapshot
+
+
+def apply_variant(snapshot: Snapshot, variant: Dict[str, Any]) -> None:
+    """
+    Free riders keep uploading nothing, the budgets only change for the clients that give. See Client.set_limits
+    for when they take effect
+    """
+    for client in snapshot.agents:
+        client.set_limits(
+            up=Points(variant['max_up']) if 'max_up' in variant and client.max_up != no_points else None,
+            down=Points(variant['max_down']) if 'max_down' in variant else None)
+        if 'peer_size' in variant:
+            client.peer_size = variant['peer_size']
+            snapshot.swarm.update_saturation(client)
+
+
+def variant_name(variant: Dict[str, Any]) -> str:
+    return '_'.join(f"{k}{v}" for k, v in sorted(variant.items())) or 'base'
+
+
+def run_variant(job: Tuple[str, Dict[str, Any], int, str]) -> str:
+    """ One variant from the snapshot up to iterations, returns the results file it wrote """
+    snapshot_path, variant, iterations, output_folder = job
+    snapshot = load_snapshot(snapshot_path)
+    apply_variant(snapshot, variant)
+    metadata = dict(snapshot.extra['metadata'], **variant, iterations=iterations, forked_from=snapshot_path,
+                    fork_iteration=snapshot.iteration)
+    output = os.path.join(output_folder, f"{variant_name(variant)}.jsonl")
+    with ResultWriter(output, metadata) as writer:
+        # the warm-up, as the snapshot's own run recorded it
+        _, warmup = stream_results(snapshot.extra['results'])
+        for iteration, entries in warmup:
+            writer.write_entries(iteration, entries)
+        for iteration, states in enumerate(Model.resume(snapshot, iterations, CheckLevel.OFF), snapshot.iteration):
+            writer.write_iteration(iteration, states)
+    return output
+
+
+def fork(snapshot_path: str, variants: List[Dict[str, Any]], iterations: int, output_folder: str,
+         processes: Optional[int] = None) -> List[str]:
+    os.makedirs(output_folder, exist_ok=True)
+    jobs = [(snapshot_path, x, iterations, output_folder) for x in variants]
+    with Pool(processes) as pool:
+        return pool.map(run_variant, jobs)
+
+
+def parse_variant(text: str) -> Dict[str, Any]:
+    """ max_up=50,max_down=100 """
+    variant = {}
+    for assignment in filter(None, text.split(',')):
+        k, v = assignment.split('=', 1)
+        if k not in VARIANT_FIELDS:
+            raise ValueError(f"variants can only change {', '.join(VARIANT_FIELDS)}, not {k}")
+        variant[k] = VARIANT_FIELDS[k](v)
+    return variant
+
+
+if __name__ == '__main__':
+    try:
+        if argv[1] == 'warm':
+            strategy = getattr(strategies, argv[2])
+            iterations, good, bad, peer_size, max_up, max_down, warmup = (int(x) for x in argv[3:10])
+            warm((strategy, iterations, good, bad, peer_size, Points(max_up), Points(max_down)), warmup, argv[10])
+        elif argv[1] == 'fork':
+            for x in fork(argv[2], [parse_variant(x) for x in argv[5:]], int(argv[3]), argv[4]):
+                print(x)
+        else:
+            raise IndexError
+    except (IndexError, ValueError, AttributeError) as e:
+        if isinstance(e, ValueError):
+            print(e)
+        print(f"usage: {argv[0]} warm strategy iterations #good #bad peer_size max_up max_down warmup snapshot.ckpt\n"
+              f"       {argv[0]} fork snapshot.ckpt iterations output_folder variant [variant ...]\n"
+              f"a variant is a comma separated list of {', '.join(f'{k}=' for k in VARIANT_FIELDS)}")
@@ -1,15 +1,29 @@
 import os
-from itertools import chain
-from json import dumps
-from multiprocessing.pool import Pool
-from random import seed
-from typing import Tuple, Type, Iterable
+from collections import defaultdict
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from functools import partial
+from itertools import chain, count
+from random import Random
+from time import time
+from typing import Tuple, Type, Iterable, Optional, Dict, Any, List
 
 from client import Client
+from convergence import CRITERIA, make_monitor
+from events import EventRecorder
 from extra_types import Points, no_points
-from model import Model
+from model import Model, CheckLevel
+from profiler import Profiler, merge
+from replicates import METRICS, ReplicatePolicy
+from results_io import ResultWriter, ColumnarWriter, read_metadata, COLUMNAR_SUFFIX, STREAM_SUFFIX
 from strategies import DropZeros, NoStrategy, OptimisticUnchoking, GainValueUnchoking, DemeritChoking, Strategy
+from scheduler import CostModel, run_scheduled, task_params, worker_count
 from swarm import Swarm
+from sweep_cache import Manifest, task_key, task_seed, COMPLETED, FAILED, IN_FLIGHT
+from vectorized_model import VectorizedModel
+from bulk_model import BulkModel
+from event_model import EventModel
+from checkpoint import Checkpointer, load_snapshot, SUFFIX as CHECKPOINT_SUFFIX
 
 """
 For non-BitTorrent
@@ -25,59 +39,197 @@ For BitTorrent strats
 """
 
 Task = Tuple[Type[Strategy], int, int, int, int, Points, Points]
+# A task, which replicate of it, and its cache key
+Job = Tuple[Task, int, str]
 
+RESULTS_FOLDER = './results'
 
-def run_task(t: Task):
+# Every replicate of every task runs on its own generator, seeded from this and its parameters by task_seed
+SEED = 0
+
+
+@dataclass(frozen=True)
+class RunOptions:
+    model: Type[Model] = Model
+    check_level: CheckLevel = CheckLevel.FULL
+    record_events: bool = False
+    columnar: bool = False
+    stop_on: Tuple[str, ...] = ()
+    stable_for: int = 10
+    profile: bool = True
+    checkpoint_every: int = 0
+
+    def cache_fields(self) -> Dict[str, Any]:
+        """ The options that change what a task writes, and therefore belong in its cache key """
+        return {
+            'model': self.model.__name__,
+            'columnar': self.columnar,
+            'stop_on': list(self.stop_on),
+            'stable_for': self.stable_for
+        }
+
+
+def output_file(t: Task, options: RunOptions, replicate: int = 0) -> str:
+    strategy, iterations, num_good_clients, num_free_riders, peer_size, max_up, max_down = t
+    suffix = COLUMNAR_SUFFIX if options.columnar else STREAM_SUFFIX
+    # the first replicate keeps the name single runs always had
+    replicate_suffix = f"_r{replicate}" if replicate else ""
+    return f"{RESULTS_FOLDER}/{strategy.__name__}/{iterations}_{num_good_clients}_{num_free_riders}_{peer_size}_{max_up}_{max_down}{replicate_suffix}{suffix}"
+
+
+def events_file(output: str) -> str:
+    return os.path.splitext(output)[0] + '.events'
+
+
+def build_swarm(t: Task, swarm: Swarm) -> Swarm:
+    """ Join the clients of a task to an empty swarm """
+    strategy, iterations, num_good_clients, num_free_riders, peer_size, max_up, max_down = t
+    all_agents = chain(
+        (Client(
+            strat=strategy,
+            up=Points(max_up),
+            down=Points(max_down),
+            peer_size=peer_size,
+            swarm=swarm,
+            iterations=iterations
+        ) for _ in range(num_good_clients)),
+        (Client(
+            strat=strategy,
+            up=no_points,
+            down=Points(max_down),
+            peer_size=peer_size,
+            swarm=swarm,
+            iterations=iterations
+        ) for _ in range(num_free_riders))
+    )
+
+    [swarm.join(x) for x in all_agents]
+    return swarm
+
+
+def run_task(t: Task, options: RunOptions = RunOptions(), replicate: int = 0) -> Dict[str, Any]:
+    """ Runs one replicate of a task and writes its results, returns the summary the replicate policy looks at """
+    strategy, iterations, num_good_clients, num_free_riders, peer_size, max_up, max_down = t
+    OUTPUT_FILE = output_file(t, options, replicate)
+    if not os.path.isdir(os.path.dirname(OUTPUT_FILE)):
+        os.makedirs(os.path.dirname(OUTPUT_FILE))
+
+    seed = task_seed(t, SEED, replicate)
+    # is_done checks the output against it, another sweep's options write to the same file
+    key = task_key(t, seed, options.cache_fields())
+    checkpoint_path = os.path.splitext(OUTPUT_FILE)[0] + CHECKPOINT_SUFFIX
+    # a stream cut short is picked up again from its latest snapshot, .cols outputs and event traces start over
+    resumable = options.checkpoint_every > 0 and not options.columnar and not options.record_events
+    snapshot = load_snapshot(checkpoint_path) if resumable and os.path.exists(checkpoint_path) else None
+    if snapshot is not None and snapshot.extra.get('cache_key') != key:
+        # taken by a sweep with other options, like another model or stop criteria, continuing it would mix the two
+        print(f"starting {OUTPUT_FILE} over, its snapshot was taken with other options")
+        os.remove(checkpoint_path)
+        snapshot = None
+    if snapshot is not None:
+        try:
+            if read_metadata(OUTPUT_FILE).get('cache_key') != key:
+                raise ValueError("another sweep has written it since")
+            writer = ResultWriter.resume(OUTPUT_FILE, snapshot.iteration)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"starting {OUTPUT_FILE} over, it does not match its snapshot: {e}")
+            snapshot = None
+
+    if snapshot is None:
+        recorder = EventRecorder(path=events_file(OUTPUT_FILE)) if options.record_events else None
+        profiler = Profiler() if options.profile else None
+        swarm = build_swarm(t, Swarm(recorder, Random(seed), profiler))
+
+        metadata = {
+            'strategy': strategy.__name__,
+            'iterations': iterations,
+            'max_up': max_up,
+            'max_down': max_down,
+            'starting_good_clients': num_good_clients,
+            'starting_bad_clients': num_free_riders,
+            'peer_size': peer_size,
+            'seed': seed,
+            'replicate': replicate,
+            'cache_key': key
+        }
+        convergence = make_monitor(options.stop_on, options.stable_for)
+        progress: Dict[str, Any] = {'end': None, 'recorded': 0, 'free_riders': 0.}
+        writer = (ColumnarWriter if options.columnar else ResultWriter)(OUTPUT_FILE, metadata)
+    else:
+        recorder = None
+        swarm, convergence = snapshot.swarm, snapshot.convergence
+        profiler = swarm.profiler
+        progress = {k: v for k, v in snapshot.extra.items() if k != 'cache_key'}
+
+    checkpoint = None
+    if resumable:
+        def where_we_are() -> Dict[str, Any]:
+            # the iterations before the snapshot have to be on disk for it to be resumed from
+            writer.flush()
+            return dict(progress, cache_key=key)
+        checkpoint = Checkpointer(checkpoint_path, options.checkpoint_every, where_we_are)
+
+    with writer:
+        if snapshot is None:
+            states_by_iteration = options.model.run(swarm, iterations, options.check_level, convergence, checkpoint)
+        else:
+            states_by_iteration = options.model.resume(snapshot, iterations, options.check_level, checkpoint)
+        for iteration, y in enumerate(states_by_iteration, snapshot.iteration if snapshot is not None else 0):
+            states = list(y)
+            writer.write_iteration(iteration, states)
+            # same end as ResultSet.end, the first iteration nothing moved in
+            if progress['end'] is None and sum(x.amount_acquired for x in states) == 0:
+                progress['end'] = iteration + 1
+            progress['free_riders'] = sum(x.free_rider for x in states) / len(states)
+            progress['recorded'] = iteration + 1
+        footer = convergence.summary() if convergence is not None else {}
+        if profiler is not None:
+            footer['profile'] = profiler.summary()
+        if snapshot is not None:
+            footer['resumed_from'] = snapshot.iteration
+        writer.close(**footer)
+    if resumable and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if recorder is not None:
+        recorder.close()
+    end = progress['end'] if progress['end'] is not None else progress['recorded']
+    summary = {'iterations': iterations, 'end': end, 'free_riders': progress['free_riders']}
+    if profiler is not None:
+        summary['profile'] = profiler.summary()
+    return summary
+
+
+def print_profiles(profiles: Dict[str, List[Dict[str, Dict[str, Any]]]]) -> None:
+    """ Where the runs of every strategy spent their time, phases as a share of the run """
+    for strategy, summaries in sorted(profiles.items()):
+        total = merge(summaries)
+        # the strategy hooks are part of the run's own phases, counting them again would exceed 100%
+        run_seconds = sum(x['seconds'] for k, x in total.items() if not k.startswith('strategy.'))
+        print(f"{strategy}, {len(summaries)} runs, {run_seconds:.1f}s")
+        for phase, x in sorted(total.items(), key=lambda kv: -kv[1]['seconds']):
+            print(f"  {phase:30} {x['seconds']:10.2f}s {x['seconds'] / (run_seconds or 1):7.1%} {x['calls']:12} calls")
+
+
+def run_cached(job: Job, options: RunOptions, manifest: Manifest) -> Optional[Dict[str, Any]]:
+    """ run_task, journaling the task's progress in the manifest under its cache key. None if it failed """
+    t, replicate, key = job
+    name = os.path.basename(output_file(t, options, replicate))
+    manifest.record(key, IN_FLIGHT, task=name, strategy=t[0].__name__, pid=os.getpid())
+    start = time()
     try:
-        strategy, iterations, num_good_clients, num_free_riders, peer_size, max_up, max_down = t
-        swarm = Swarm()
-        all_agents = chain(
-            (Client(
-                strat=strategy,
-                up=Points(max_up),
-                down=Points(max_down),
-                peer_size=peer_size,
-                swarm=swarm,
-                iterations=iterations
-            ) for _ in range(num_good_clients)),
-            (Client(
-                strat=strategy,
-                up=no_points,
-                down=Points(max_down),
-                peer_size=peer_size,
-                swarm=swarm,
-                iterations=iterations
-            ) for _ in range(num_free_riders))
-        )
-
-        [swarm.join(x) for x in all_agents]
-
-        OUTPUT_FILE = f"./results/{strategy.__name__}/{iterations}_{num_good_clients}_{num_free_riders}_{peer_size}_{max_up}_{max_down}.json"
-        if not os.path.isdir(os.path.dirname(OUTPUT_FILE)):
-            os.makedirs(os.path.dirname(OUTPUT_FILE))
-        with open(OUTPUT_FILE, 'w') as f:
-            f.write(dumps(
-                {
-                    'metadata': {
-                        'strategy': strategy.__name__,
-                        'iterations': iterations,
-                        'max_up': max_up,
-                        'max_down': max_down,
-                        'starting_good_clients': num_good_clients,
-                        'starting_bad_clients': num_free_riders,
-                        'peer_size': peer_size
-                    },
-                    'data': tuple(
-                        chain.from_iterable(
-                            (x.to_json(iteration) for x in y) for iteration, y in enumerate(Model.run(swarm, iterations))))
-                }
-            ))
+        summary = run_task(t, options, replicate)
     except Exception as e:
         print("got exception ", e)
+        manifest.record(key, FAILED, task=name, strategy=t[0].__name__, error=repr(e))
+        return None
+    output = output_file(t, options, replicate)
+    # event traces aren't part of the key, the record says whether this run left one
+    traces = {'events': events_file(output)} if options.record_events else {}
+    manifest.record(key, COMPLETED, task=name, strategy=t[0].__name__, output=output, params=task_params(t),
+                    replicate=replicate, summary=summary, seconds=time() - start, **traces)
+    return summary
 
 
-seed(0)
-
 all_strategies = (DropZeros, NoStrategy, OptimisticUnchoking, GainValueUnchoking, DemeritChoking)
 
 
@@ -92,10 +244,114 @@ def task_generator() -> Iterable[Task]:
                             yield (strat, iter_count, num_good, num_bad, peer_size, Points(max_up), Points(max_down))
 
 
-for strategy in all_strategies:
-    if not os.path.isdir(f"./results/{strategy.__name__}"):
-        os.makedirs(f"./results/{strategy.__name__}")
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    models = parser.add_mutually_exclusive_group()
+    models.add_argument('--vectorized', action='store_true',
+                        help="run the content exchange on NumPy arrays, see vectorized_model.py")
+    models.add_argument('--bulk', action='store_true',
+                        help="resolve every round of the exchange in closed form per pair, see bulk_model.py")
+    models.add_argument('--discrete-event', action='store_true',
+                        help="run the exchange as timed transfers on an event queue, see event_model.py")
+    parser.add_argument('--check', choices=[x.value for x in CheckLevel], default=CheckLevel.INCREMENTAL.value,
+                        help="how much of the peer graph to verify while running")
+    parser.add_argument('--events', action='store_true',
+                        help="record connects, disconnects and chokes next to every result, see events.py")
+    parser.add_argument('--stop', default='zero',
+                        help=f"comma separated criteria to stop a run early on, from {', '.join(CRITERIA)}, "
+                             f"or '' to always run every iteration")
+    parser.add_argument('--stable-for', type=int, default=10,
+                        help="iterations the population or topology has to stay the same to count as converged")
+    parser.add_argument('--columnar', action='store_true',
+                        help="write results as memory mappable .cols directories instead of .jsonl, see results_io.py")
+    parser.add_argument('--force', action='store_true',
+                        help="rerun every task, even the ones the manifest says are done with the same inputs")
+    parser.add_argument('--memory-budget-mb', type=int, default=0,
+                        help="cap the number of workers so the biggest tasks fit in this much memory together")
+    parser.add_argument('--progress-every', type=float, default=10.,
+                        help="seconds between progress reports")
+    parser.add_argument('--checkpoint-every', type=int, default=0,
+                        help="snapshot every run this often (in iterations) next to its output, a rerun of a task "
+                             "that died resumes from its latest snapshot, see checkpoint.py")
+    parser.add_argument('--no-profile', action='store_true',
+                        help="don't time the phases of every run into its metadata and the sweep report")
+    parser.add_argument('--replicates', type=int, default=1,
+                        help="run every configuration up to this many times with different seeds, see replicates.py")
+    parser.add_argument('--min-replicates', type=int, default=3,
+                        help="replicates every configuration gets before its confidence intervals are looked at")
+    parser.add_argument('--ci-tolerance', type=float, default=.02,
+                        help="stop adding replicates once the 95%% confidence intervals are at most this wide each side")
+    parser.add_argument('--ci-metrics', default='end,free_riders',
+                        help=f"comma separated metrics the confidence intervals are taken on, from {', '.join(METRICS)}")
+    args = parser.parse_args()
+    stop_on = [x for x in args.stop.split(',') if x]
+    if set(stop_on) - CRITERIA.keys():
+        parser.error(f"unknown stop criteria {', '.join(set(stop_on) - CRITERIA.keys())}")
+    ci_metrics = [x for x in args.ci_metrics.split(',') if x]
+    if set(ci_metrics) - METRICS.keys():
+        parser.error(f"unknown metrics {', '.join(set(ci_metrics) - METRICS.keys())}")
+
+    options = RunOptions(
+        model=(VectorizedModel if args.vectorized else BulkModel if args.bulk
+               else EventModel if args.discrete_event else Model),
+        check_level=CheckLevel(args.check),
+        record_events=args.events,
+        columnar=args.columnar,
+        stop_on=tuple(stop_on),
+        stable_for=args.stable_for,
+        profile=not args.no_profile,
+        checkpoint_every=args.checkpoint_every
+    )
+
+    for strategy in all_strategies:
+        if not os.path.isdir(f"{RESULTS_FOLDER}/{strategy.__name__}"):
+            os.makedirs(f"{RESULTS_FOLDER}/{strategy.__name__}")
+
+    manifest = Manifest(RESULTS_FOLDER)
+    records = manifest.load()
+    done = {} if args.force else records
+    # earlier timings calibrate the estimates even when --force ignores the cached results
+    cost_model = CostModel(records.values())
+    policy = ReplicatePolicy(args.replicates, args.min_replicates, args.ci_tolerance, tuple(ci_metrics))
+
+    configs = list(task_generator())
+    attempted = dict.fromkeys(configs, 0)
+    summaries: Dict[Task, List[Dict[str, Any]]] = {t: [] for t in configs}
+    # phase timings of the replicates this sweep ran, by strategy
+    profiles: Dict[str, List[Dict[str, Dict[str, Any]]]] = defaultdict(list)
+    # Every round schedules the replicates each configuration still needs, all of them in parallel
+    for round_number in count(1):
+        jobs: List[Job] = [(t, r, task_key(t, task_seed(t, SEED, r), options.cache_fields()))
+                           for t in configs
+                           for r in range(attempted[t], attempted[t] + policy.more(attempted[t], summaries[t]))]
+        if not jobs:
+            break
+        todo = []
+        for t, r, key in jobs:
+            attempted[t] += 1
+            if manifest.is_done(done, key, options.record_events) and 'summary' in done[key]:
+                summaries[t].append(done[key]['summary'])
+            else:
+                todo.append((t, r, key))
+        print(f"round {round_number}: {len(jobs) - len(todo)} of {len(jobs)} replicates are cached, running {len(todo)}")
+        if not todo:
+            continue
+
+        costs = [cost_model.cost(task_params(t)) for t, _, _ in todo]
+        processes = worker_count((task_params(t) for t, _, _ in todo), args.memory_budget_mb)
+        succeeded = 0
+        for (t, _, _), summary in run_scheduled(partial(run_cached, options=options, manifest=manifest), todo,
+                                                costs, processes, args.progress_every):
+            if summary is not None:
+                summaries[t].append(summary)
+                succeeded += 1
+                if 'profile' in summary:
+                    profiles[t[0].__name__].append(summary['profile'])
+        print(f"{succeeded} replicates completed, {len(todo) - succeeded} failed")
+
+    if policy.max_replicates > 1:
+        unsettled = sum(not policy.converged(summaries[t]) for t in configs)
+        print(f"{len(configs) - unsettled} of {len(configs)} configurations converged within {policy.max_replicates} replicates")
 
-tasks: Iterable[Task] = list(task_generator())
-with Pool() as p:
-    p.map(run_task, tasks)
+    if profiles:
+        print_profiles(profiles)
@@ -1,62 +1,159 @@
-from random import shuffle
+from collections import Counter
+from enum import Enum
+from itertools import chain
+from random import Random
 from time import time
-from typing import Tuple, List, Sequence, TypeVar, Iterable, Iterator
+from typing import Callable, Tuple, List, Sequence, TypeVar, Iterable, Iterator, Optional
 
-from client import Result
+from checkpoint import Snapshot
+from client import Client, Result
+from convergence import ConvergenceMonitor
+from profiler import (Profiler, timed, INIT_PEERS, CHECKS, EXCHANGE, STATES, RESET_VALUES, BEFORE_RESET, RESET,
+                      AFTER_RESET)
 from swarm import Swarm
 
 T = TypeVar('T')
 
 
-def random_iteration(iterable: Iterable[T]) -> Iterator[T]:
+def random_iteration(iterable: Iterable[T], rng: Random) -> Iterator[T]:
     l = list(iterable)
-    shuffle(l)
+    rng.shuffle(l)
     yield from l
 
 
+class CheckLevel(Enum):
+    """ How much of the peer graph Model.run verifies at each checkpoint """
+    OFF = 'off'
+    # a random handful of clients
+    SAMPLED = 'sampled'
+    # only the clients whose connections changed since the last checkpoint
+    INCREMENTAL = 'incremental'
+    # every client, counting in-degrees from scratch
+    FULL = 'full'
+
+
+SAMPLE_SIZE = 32
+
+# Sampled checks get their own generator so that turning them on does not change the simulation
+_check_random = Random(0)
+
+
 def do_assertions(all_agents):
+    in_degree = Counter(chain.from_iterable(x.peers for x in all_agents))
     for client in all_agents:
         for p in client.peers:
-            assert (client in p.peers)
-        assert (sum(1 for x in all_agents if client in x.peers) <= client.peer_size)
+            assert p.has_peer(client)
+        assert (in_degree[client] <= client.peer_size)
+
+
+def check_clients(clients: Iterable[Client]):
+    """ Same invariants as do_assertions, but trusting the in-degrees kept by the PeerGraph """
+    for client in clients:
+        for p in client.peers:
+            assert p.has_peer(client)
+        assert (client.in_degree <= client.peer_size)
+
+
+def check_invariants(swarm: Swarm, all_agents: Sequence[Client], level: CheckLevel):
+    graph = swarm.peer_graph
+    touched = graph.take_touched()
+    if level is CheckLevel.FULL:
+        do_assertions(all_agents)
+    elif level is CheckLevel.INCREMENTAL:
+        check_clients(graph.client(x) for x in touched)
+    elif level is CheckLevel.SAMPLED:
+        check_clients(_check_random.sample(all_agents, min(SAMPLE_SIZE, len(all_agents))))
 
 
 class Model:
 
     @staticmethod
-    def run(swarm: Swarm, iterations: int) -> Iterator[Iterator[Result]]:
+    def exchange(all_agents: Sequence[Client], rng: Random) -> None:
+        """ Move content between peers one unit at a time until nobody can get any more """
+        # Connections don't change during the exchange, and what every agent still wants is counted down here
+        peers = {x: x.peers for x in all_agents}
+        wanted = {x: x.max_down - x.amount_acquired for x in all_agents}
+        # The agents still getting content, they leave as soon as they are satisfied or none of their peers give.
+        # Removing in place keeps the set's iteration order, and with it every shuffle, what it always was
+        remaining_agents = set(all_agents)
+        remaining_agents.difference_update([x for x in all_agents if wanted[x] <= 0])
+        while remaining_agents:
+            # Iterate in random order
+            for agent in random_iteration(remaining_agents, rng):
+                # Iterate all peers of that agent in random order
+                for peer in random_iteration(peers[agent], rng):
+                    # peers with nothing left to upload would refuse anyway
+                    if peer.upload_remaining > 0 and peer.ask_for_content(agent):  # If they gave us content
+                        agent.give_content(peer)
+                        wanted[agent] -= 1
+                        if not wanted[agent]:
+                            remaining_agents.remove(agent)
+                        break
+                else:
+                    # None of the peers gave them something
+                    remaining_agents.remove(agent)
+
+    @staticmethod
+    def reconnect(all_agents: Sequence[Client], current_iteration: int, rng: Random,
+                  profiler: Optional[Profiler]) -> None:
+        """ Every client lets its strategy pick its peers for the next iteration, each phase in a new random order """
+        c = current_iteration
+        timed(profiler, BEFORE_RESET, lambda: [x.before_reset() for x in random_iteration(all_agents, rng)])
+        timed(profiler, RESET, lambda: [x.reset(c) for x in random_iteration(all_agents, rng)])
+        timed(profiler, AFTER_RESET, lambda: [x.after_reset(c) for x in random_iteration(all_agents, rng)])
+
+    @classmethod
+    def run(cls, swarm: Swarm, iterations: int, check_level: CheckLevel = CheckLevel.FULL,
+            convergence: Optional[ConvergenceMonitor] = None,
+            checkpoint: Optional[Callable[[Snapshot], None]] = None) -> Iterator[Iterator[Result]]:
+        """
+        Yields the states of every client once per iteration, stopping early once convergence says so.
+        Every stage is timed into swarm.profiler when the swarm has one, and checkpoint gets a Snapshot
+        to resume from at the end of every iteration
+        """
+        profiler = swarm.profiler
         all_agents = list(swarm.all_clients())
-        [x.init_peers() for x in all_agents]
-
-        for c in range(iterations):
-            print("Iteration", c)
-
-            do_assertions(all_agents)
-
-            remaining_agents = set(all_agents)
-            while remaining_agents:
-                # filter out the ones that don't want content
-                remaining_agents -= {x for x in all_agents if not x.wants_content()}
-                # Iterate in random order
-                for agent in random_iteration(remaining_agents):
-                    # Iterate all peers of that agent in random order
-                    for peer in random_iteration(agent.peers):
-                        if peer.ask_for_content(agent):  # If they gave us content
-                            agent.give_content(peer)
-                            break
-                    else:
-                        # None of the peers gave them something
-                        remaining_agents.remove(agent)
-            yield (x.get_state() for x in all_agents)
-
-            [x.reset_values() for x in all_agents]
-
-            do_assertions(all_agents)
+        timed(profiler, INIT_PEERS, lambda: [x.init_peers() for x in all_agents])
+
+        recorder = swarm.recorder
+        if recorder is not None:
+            for x in all_agents:
+                if x.get_state().free_rider:
+                    recorder.free_rider(x.id, True)
+
+        yield from cls._iterate(Snapshot(0, swarm, all_agents, convergence), iterations, check_level, checkpoint)
+
+    @classmethod
+    def resume(cls, snapshot: Snapshot, iterations: int, check_level: CheckLevel = CheckLevel.FULL,
+               checkpoint: Optional[Callable[[Snapshot], None]] = None) -> Iterator[Iterator[Result]]:
+        """ Same as run, continuing from snapshot up to iterations in total """
+        yield from cls._iterate(snapshot, iterations, check_level, checkpoint)
+
+    @classmethod
+    def _iterate(cls, start: Snapshot, iterations: int, check_level: CheckLevel,
+                 checkpoint: Optional[Callable[[Snapshot], None]]) -> Iterator[Iterator[Result]]:
+        swarm, all_agents, convergence = start.swarm, start.agents, start.convergence
+        profiler = swarm.profiler
+        recorder = swarm.recorder
+        for c in range(start.iteration, iterations):
+            if recorder is not None:
+                recorder.iteration(c)
+
+            timed(profiler, CHECKS, check_invariants, swarm, all_agents, check_level)
+
+            timed(profiler, EXCHANGE, cls.exchange, all_agents, swarm.rng)
+            states = timed(profiler, STATES, lambda: [x.get_state() for x in all_agents])
+            yield iter(states)
+
+            if convergence is not None and convergence.update(c, states):
+                return
+
+            timed(profiler, RESET_VALUES, lambda: [x.reset_values() for x in all_agents])
+
+            timed(profiler, CHECKS, check_invariants, swarm, all_agents, check_level)
             # Find new peers
-            print("--before--")
-            [x.before_reset() for x in random_iteration(all_agents)]
-            print("--reset--")
-            [x.reset(c) for x in random_iteration(all_agents)]
-            print("--after--")
-            [x.after_reset(c) for x in random_iteration(all_agents)]
-            do_assertions(all_agents)
+            cls.reconnect(all_agents, c, swarm.rng, profiler)
+            timed(profiler, CHECKS, check_invariants, swarm, all_agents, check_level)
+
+            if checkpoint is not None:
+                checkpoint(Snapshot(c + 1, swarm, all_agents, convergence))
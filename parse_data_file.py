@@ -1,138 +1,122 @@
-from itertools import count, chain
-from json import loads
+from itertools import count
 from sys import argv
 
-import cv2
 import matplotlib.pyplot as plt
-import networkx as nx
 import numpy as np
 
+from peer_graph_video import render_frames, write_video
+from result_set import ResultSet
+from results_io import load_results, stream_results, load_columnar, recorded_iterations, finished, COLUMNAR_SUFFIX
+
 unique_val = count(0)
 
 
-def make_peer_graph(path_to_input, iterations=None):
-    vid = cv2.VideoWriter(f'./test.avi', 0, 2, (640, 480))
-    data = get_data(path_to_input)
-    G = nx.Graph()
-    target_clients = sorted(list(set(x['id'] for x in data['data'])))
-    all_peers = set(chain.from_iterable(x['peers'] for x in data['data'] if x['id'] in target_clients))
-    original_baddies = {
-        x['id'] for x in data['data'] if x['free_rider'] and x['iteration'] == 0
-    }
-    all_clients = all_peers | set(target_clients)
-    G.add_nodes_from(all_clients)
-    pos = nx.circular_layout(all_clients)
+def load_result_set(results):
+    """ Accepts a path to a results file or an already built ResultSet """
+    return results if isinstance(results, ResultSet) else ResultSet.from_path(results)
+
+
+def make_peer_graph(path_to_input, iterations=None, output='./test.avi', processes=1):
+    render_peer_graph(load_result_set(path_to_input), iterations, output, processes)
 
+
+def render_peer_graph(results, iterations=None, output='./test.avi', processes=1):
     if iterations == "end":
-        end = get_end(data)
-    elif iterations == "all":
-        end = int(data['metadata']['iterations'])
+        end = results.end
+    elif iterations in ("all", None):
+        end = int(results.num_iterations)
     else:
         end = int(iterations)
 
-    for iteration in range(end):
-        entries = [x for x in data['data'] if
-                   x['iteration'] == iteration and (x['id'] in all_peers or x['id'] in target_clients)]
-        good_entries = [x for x in entries if not x['free_rider']]
-        bad_entries = [x for x in entries if x['free_rider']]
-        clients_at_this_iter = (x for x in entries if x['id'] in target_clients)
-
-        def edges():
-            for client in clients_at_this_iter:
-                for peer in client['peers']:
-                    yield (client['id'], peer)
-
-        G.add_edges_from(edges())
-        nx.draw_networkx_nodes(G, pos, nodelist=[x['id'] for x in good_entries], node_color='g', node_size=100,
-                               alpha=0.8, with_labels=True, label="Good Citizens")
-        nx.draw_networkx_nodes(G, pos, nodelist=[x['id'] for x in bad_entries if x['id'] in original_baddies], node_color='r', node_size=100,
-                               alpha=0.8, with_labels=True, label="Free Riders")
-        nx.draw_networkx_nodes(G, pos, nodelist=[x['id'] for x in bad_entries if x['id'] not in original_baddies], node_color='y', node_size=100,
-                               alpha=0.8, with_labels=True, label="Defectors")
-        nx.draw_networkx_labels(G, pos)
-        nx.draw_networkx_edges(G, pos, alpha=0.5)
-        plt.xlim((-1.75, 1.1))
-        plt.ylim((-1.1, 1.1))
-        plt.axis("off")
-        plt.title(f"{data['metadata']['strategy']} Iteration {iteration}")
-        plt.legend(loc='upper left')
-        plt.savefig('./img.png', format='png')
-        img = cv2.imread('./img.png')
-        vid.write(img)
-        plt.clf()
-        G.remove_edges_from(list(G.edges))
-    cv2.destroyAllWindows()
-    vid.release()
+    write_video(render_frames(results, end, processes), output)
 
 
 def get_data(path_to_file):
-    with open(path_to_file) as f:
-        all_data = loads(f.read())
-        return all_data
+    return load_results(path_to_file)
+
+
+def stream_end(path_to_file):
+    """ Metadata and get_end of a results file, holding only one iteration in memory at a time """
+    metadata, summary = stream_summary(path_to_file)
+    return metadata, summary['end']
+
+
+def stream_summary(path_to_file):
+    """
+    Metadata plus the end and the final fraction of free riders of a results file, in one pass. complete is False
+    for a run without its footer, one that crashed or is waiting to be resumed, whose end is only how far it got.
+    """
+    if path_to_file.endswith(COLUMNAR_SUFFIX):
+        results = load_columnar(path_to_file)
+        metadata = results.metadata
+        num_iterations = recorded_iterations(metadata)
+        iteration = np.asarray(results.columns['iteration'])
+        totals = np.bincount(iteration, weights=results.columns['amount_acquired'],
+                             minlength=num_iterations)[:num_iterations]
+        zeros = np.flatnonzero(totals == 0)
+        last = iteration == iteration[-1] if len(iteration) else iteration
+        free_riders = float(np.mean(results.columns['free_rider'][last])) if last.any() else 0.
+        return metadata, {'end': int(zeros[0]) + 1 if len(zeros) else num_iterations, 'free_riders': free_riders,
+                          'complete': finished(path_to_file, metadata)}
+    metadata, iterations = stream_results(path_to_file)
+    expected = 0
+    end = None
+    free_riders = 0.
+    for iteration, entries in iterations:
+        # a missing iteration counts as nothing acquired, same as get_end
+        if end is None and (iteration != expected or sum(a['amount_acquired'] for a in entries) == 0):
+            end = expected + 1
+        free_riders = sum(a['free_rider'] for a in entries) / len(entries)
+        expected += 1
+    # the footer is only in metadata once the stream is exhausted
+    complete = finished(path_to_file, metadata)
+    if end is None:
+        end = expected + 1 if expected < recorded_iterations(metadata) else recorded_iterations(metadata)
+    return metadata, {'end': end, 'free_riders': free_riders, 'complete': complete}
 
 
 def get_end(all_data):
-    try:
-        all_points = [sum([a['amount_acquired'] for a in all_data['data'] if a['iteration'] == x] or [0]) for x in
-                      range(all_data['metadata']['iterations'])]
-        return all_points.index(0) + 1
-    except ValueError:
-        return all_data['metadata']['iterations']
-
-
-def get_good_bad_partition(all_data):
-    good_guys = [
-        y for y in all_data['data'] if not y['free_rider']
-    ]
-
-    bad_guys = [
-        y for y in all_data['data'] if y['free_rider']
-    ]
-    return good_guys, bad_guys
+    return ResultSet.from_data(all_data).end
 
 
 def make_population_graphs(path_to_file):
-    all_data = get_data(path_to_file)
-    good, bad = get_good_bad_partition(all_data)
+    results = load_result_set(path_to_file)
 
-    num_agents = all_data['metadata']['starting_good_clients'] + all_data['metadata']['starting_bad_clients']
-    num_iterations = get_end(all_data)
+    num_agents = results.metadata['starting_good_clients'] + results.metadata['starting_bad_clients']
+    num_iterations = results.end
     f = plt.figure(next(unique_val))
 
-    def add_plot(dataset, color, label, order):
-        plt.plot([sum(a['iteration'] == x for a in dataset) for x in range(num_iterations)], color, label=label,
-                 zorder=order)
+    def add_plot(cls, color, label, order):
+        plt.plot(results.counts[cls][:num_iterations], color, label=label, zorder=order)
 
-    plt.title(f"{all_data['metadata']['strategy']}")
+    plt.title(f"{results.metadata['strategy']}")
     plt.ylim(0 - .1 * num_agents, 1.1 * num_agents)
     plt.ylabel("Population Size")
     plt.xlabel("Iterations")
-    add_plot(good, 'g', "Normal Users", 1)
-    add_plot(bad, 'r', "Free Rider", 2)
+    add_plot('good', 'g', "Normal Users", 1)
+    add_plot('bad', 'r', "Free Rider", 2)
     plt.legend()
     f.show()
 
 
 def make_happiness_graphs(path_to_file):
-    all_data = get_data(path_to_file)
-    good, bad = get_good_bad_partition(all_data)
+    results = load_result_set(path_to_file)
 
     # Find the end
-    num_iterations = get_end(all_data)
+    num_iterations = results.end
     f = plt.figure(next(unique_val))
 
-    def add_plot(dataset, color, label, order):
-        plt.plot([np.mean([a['amount_acquired'] for a in dataset if a['iteration'] == x] or [0]) for x in
-                  range(num_iterations)], color, label=label, zorder=order)
+    def add_plot(cls, color, label, order):
+        plt.plot(results.mean_acquired[cls][:num_iterations], color, label=label, zorder=order)
 
-    plt.title(f"{all_data['metadata']['strategy']}")
+    plt.title(f"{results.metadata['strategy']}")
     plt.ylabel("Mean Files Acquired")
     plt.xlabel("Iterations")
-    add_plot(good, 'g', "Normal Users", 1)
-    add_plot(bad, 'r', "Free Rider", 2)
-    add_plot(all_data['data'], 'b', "All Users", 0)
+    add_plot('good', 'g', "Normal Users", 1)
+    add_plot('bad', 'r', "Free Rider", 2)
+    add_plot('all', 'b', "All Users", 0)
 
-    plt.ylim(0, all_data['metadata']['max_down'])
+    plt.ylim(0, results.metadata['max_down'])
 
     plt.legend()
 
@@ -140,27 +124,21 @@ def make_happiness_graphs(path_to_file):
 
 
 def make_utility_graphs(path_to_file):
-    all_data = get_data(path_to_file)
-    good, bad = get_good_bad_partition(all_data)
+    results = load_result_set(path_to_file)
 
     # Find the end
-    num_iterations = get_end(all_data)
+    num_iterations = results.end
     f = plt.figure(next(unique_val))
 
-    def utility(entry):
-        return (entry['amount_acquired'] / all_data['metadata']['max_down']) - (
-            (.25 * (entry['willing_to_give'] - entry['amount_remaining']) / all_data['metadata']['max_up']) if not entry['free_rider'] else 0)
-
-    def add_plot(dataset, color, label, order):
-        plt.plot([np.mean([utility(a) for a in dataset if a['iteration'] == x] or [0]) for x in range(num_iterations)],
-                 color, label=label, zorder=order)
+    def add_plot(cls, color, label, order):
+        plt.plot(results.mean_utility[cls][:num_iterations], color, label=label, zorder=order)
 
-    plt.title(f"{all_data['metadata']['strategy']}")
+    plt.title(f"{results.metadata['strategy']}")
     plt.ylabel("Mean Utility")
     plt.xlabel("Iterations")
-    add_plot(good, 'g', "Normal Users", 1)
-    add_plot(bad, 'r', "Free Rider", 2)
-    add_plot(all_data['data'], 'b', "All Users", 0)
+    add_plot('good', 'g', "Normal Users", 1)
+    add_plot('bad', 'r', "Free Rider", 2)
+    add_plot('all', 'b', "All Users", 0)
 
     ylim = plt.ylim()
 
@@ -172,11 +150,13 @@ def make_utility_graphs(path_to_file):
 
 
 def make_all_graphs(path_to_file, vid=False):
-    make_population_graphs(path_to_file)
-    make_happiness_graphs(path_to_file)
-    make_utility_graphs(path_to_file)
+    # parse the file once and share it between the graphs
+    results = load_result_set(path_to_file)
+    make_population_graphs(results)
+    make_happiness_graphs(results)
+    make_utility_graphs(results)
     if vid:
-        make_peer_graph(path_to_file)
+        make_peer_graph(results)
 
 
 if __name__ == '__main__':
@@ -184,8 +164,11 @@ if __name__ == '__main__':
     path = argv[2]
     cmd = argv[1]
     additional = None
-    if len(argv) == 4:
+    if len(argv) >= 4:
         additional = argv[3]
+    # vid also takes where to write the video and how many processes render it
+    video_output = argv[4] if len(argv) >= 5 else './test.avi'
+    video_processes = int(argv[5]) if len(argv) >= 6 else 1
     try:
         {
             'pop': make_population_graphs,
@@ -193,7 +176,7 @@ if __name__ == '__main__':
             'util': make_utility_graphs,
             'all': make_all_graphs,
             'allv': lambda x: make_all_graphs(x, True),
-            'vid': lambda x: make_peer_graph(x, iterations=additional)
+            'vid': lambda x: make_peer_graph(x, iterations=additional, output=video_output, processes=video_processes)
         }[cmd](path)
         if cmd != 'vid':
             plt.show()
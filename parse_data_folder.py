@@ -1,27 +1,31 @@
 from collections import defaultdict
 from collections import namedtuple
-from pathlib import Path
+from itertools import count
 from sys import argv
 
 import matplotlib.pyplot as plt
 
-from parse_data_file import get_data, get_end
+from summary_index import SummaryIndex
+from sweep_cube import build_cube
 
 entry = namedtuple('entry',
                    ['strategy', 'iterations', 'max_up', 'max_down', 'starting_good_clients', 'starting_bad_clients',
-                    'peer_size'])
+                    'peer_size', 'replicate'], defaults=(0,))
 
+unique_val = count(0)
 
-def parse_data_folder(path_to_folder):
-    f = Path(path_to_folder)
+
+def parse_data_folder(path_to_folder, processes=None):
     new_data = defaultdict(lambda: dict())
-    for child in f.iterdir():
-        data = get_data(str(child))
-        end = get_end(data)
-        meta = data['metadata']
+    # only files that are new or changed since the last call get parsed, runs that did not finish are left out,
+    # see summary_index.py
+    with SummaryIndex(path_to_folder) as index:
+        index.refresh(processes)
+        runs = list(index.runs())
+    for _, meta, summary in runs:
         new_data[
             entry(meta['strategy'], meta['iterations'], meta['max_up'], meta['max_down'], meta['starting_good_clients'],
-                  meta['starting_bad_clients'], meta['peer_size'])] = end
+                  meta['starting_bad_clients'], meta['peer_size'], meta.get('replicate', 0))] = summary['end']
     return new_data
 
 
@@ -30,16 +34,73 @@ def make_a_graph(path_to_folder):
     print(data)
 
 
+def fixed_axes(assignments):
+    """ axis=value arguments """
+    return dict(x.split('=', 1) for x in assignments)
+
+
+def load_cube(path_to_folder):
+    """ build_cube, saying how many runs it left out for not having finished """
+    cube = build_cube(path_to_folder)
+    if cube.partial.sum():
+        print(f"{cube.partial.sum()} runs that did not finish are left out")
+    return cube
+
+
+def make_heatmap(path_to_folder, strategy, metric, x_axis, y_axis, *fixed):
+    """ metric of one strategy over two axes, averaged over the axes that aren't fixed """
+    cube = load_cube(path_to_folder)
+    values = cube.view(metric, (y_axis, x_axis), dict(fixed_axes(fixed), strategy=strategy))
+    f = plt.figure(next(unique_val))
+    plt.imshow(values, origin='lower', aspect='auto', cmap='viridis')
+    plt.colorbar(label=metric)
+    plt.xticks(range(len(cube.labels[x_axis])), cube.labels[x_axis])
+    plt.yticks(range(len(cube.labels[y_axis])), cube.labels[y_axis])
+    plt.xlabel(x_axis)
+    plt.ylabel(y_axis)
+    plt.title(f"{strategy} {' '.join(fixed)}")
+    f.show()
+
+
+def make_slice(path_to_folder, strategy, metric, x_axis, *fixed):
+    """ metric of one strategy along one axis """
+    cube = load_cube(path_to_folder)
+    f = plt.figure(next(unique_val))
+    plt.plot(cube.labels[x_axis], cube.view(metric, (x_axis,), dict(fixed_axes(fixed), strategy=strategy)), 'o-')
+    plt.xlabel(x_axis)
+    plt.ylabel(metric)
+    plt.title(f"{strategy} {' '.join(fixed)}")
+    f.show()
+
+
+def make_comparison(path_to_folder, metric, x_axis, *fixed):
+    """ metric along one axis, a line per strategy """
+    cube = load_cube(path_to_folder)
+    values = cube.view(metric, ('strategy', x_axis), fixed_axes(fixed))
+    f = plt.figure(next(unique_val))
+    for strategy, line in zip(cube.labels['strategy'], values):
+        plt.plot(cube.labels[x_axis], line, 'o-', label=strategy)
+    plt.xlabel(x_axis)
+    plt.ylabel(metric)
+    plt.title(' '.join(fixed))
+    plt.legend()
+    f.show()
+
+
 if __name__ == '__main__':
     # try:
     path = argv[2]
     cmd = argv[1]
-    try:
-        {
-            'a': make_a_graph
-        }[cmd](path)
+    commands = {
+        'a': make_a_graph,
+        'heat': make_heatmap,
+        'slice': make_slice,
+        'compare': make_comparison
+    }
+    if cmd not in commands:
+        print(f"valid commands are {', '.join(commands)}")
+    else:
+        commands[cmd](path, *argv[3:])
         plt.show()
-    except KeyError:
-        print("valid commands are ")
     # except:
     #    print(f"usage: {argv[0]} | path/to/json/file")
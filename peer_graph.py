@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import Dict, List, Iterable, Set, Optional, TYPE_CHECKING
+
+from extra_types import Points, no_points
+
+if TYPE_CHECKING:
+    from client import Client
+    from events import EventRecorder
+
+
+class PeerGraph:
+    """
+    Connections between all the clients of a swarm, plus how much each client got from each peer this round.
+
+    Clients are addressed by slot, the integer handed out by add_node. Row a maps every peer slot b of client a
+    to the points a received from b, so edge lookups are O(1) and rows keep their insertion order. The reverse
+    index holds, for every b, the slots of the clients that have b as a peer, and every row's total is kept
+    as it changes so total_received is O(1).
+
+    Every edge change marks both of its ends as touched, which lets invariant checks look at just the clients
+    whose connections changed since the last check, and is sent to the recorder if there is one.
+    """
+
+    def __init__(self, recorder: Optional[EventRecorder] = None):
+        self.recorder = recorder
+        self._clients: List[Client] = []
+        self._rows: List[Dict[int, Points]] = []
+        self._inbound: List[Set[int]] = []
+        self._received: List[Points] = []
+        self._touched: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def add_node(self, client: Client) -> int:
+        self._clients.append(client)
+        self._rows.append({})
+        self._inbound.append(set())
+        self._received.append(no_points)
+        return len(self._clients) - 1
+
+    def client(self, slot: int) -> Client:
+        return self._clients[slot]
+
+    def degree(self, a: int) -> int:
+        return len(self._rows[a])
+
+    def in_degree(self, b: int) -> int:
+        """ Number of clients that have b as a peer """
+        return len(self._inbound[b])
+
+    def has_edge(self, a: int, b: int) -> bool:
+        return b in self._rows[a]
+
+    def neighbors(self, a: int) -> List[Client]:
+        clients = self._clients
+        return [clients[b] for b in self._rows[a]]
+
+    def inbound(self, b: int) -> List[Client]:
+        """ The clients that have b as a peer, in slot order """
+        clients = self._clients
+        return [clients[a] for a in sorted(self._inbound[b])]
+
+    def add_edge(self, a: int, b: int) -> None:
+        assert b not in self._rows[a]
+        self._rows[a][b] = no_points
+        self._inbound[b].add(a)
+        self._touched.add(a)
+        self._touched.add(b)
+        if self.recorder is not None:
+            self.recorder.connect(self._clients[a].id, self._clients[b].id)
+
+    def remove_edge(self, a: int, b: int) -> None:
+        self._received[a] -= self._rows[a].pop(b)
+        self._inbound[b].discard(a)
+        self._touched.add(a)
+        self._touched.add(b)
+        if self.recorder is not None:
+            self.recorder.disconnect(self._clients[a].id, self._clients[b].id)
+
+    def connect(self, a: int, b: int) -> None:
+        self.add_edge(a, b)
+        self.add_edge(b, a)
+
+    def disconnect(self, a: int, b: int) -> None:
+        self.remove_edge(a, b)
+        self.remove_edge(b, a)
+
+    def set_neighbors(self, a: int, peers: Iterable[int]) -> None:
+        """ Replace the peers of a, starting every counter at zero """
+        new_row = dict.fromkeys(peers, no_points)
+        old_row = self._rows[a]
+        recorder = self.recorder
+        for b in old_row.keys() - new_row.keys():
+            self._inbound[b].discard(a)
+            self._touched.add(b)
+            if recorder is not None:
+                recorder.disconnect(self._clients[a].id, self._clients[b].id)
+        for b in new_row.keys() - old_row.keys():
+            self._inbound[b].add(a)
+            self._touched.add(b)
+            if recorder is not None:
+                recorder.connect(self._clients[a].id, self._clients[b].id)
+        self._rows[a] = new_row
+        self._received[a] = no_points
+        self._touched.add(a)
+
+    def take_touched(self) -> Set[int]:
+        """ Slots of the clients whose connections changed since the last call """
+        touched, self._touched = self._touched, set()
+        return touched
+
+    def add_contribution(self, a: int, b: int, amount: Points) -> None:
+        self._rows[a][b] += amount
+        self._received[a] += amount
+
+    def contributions(self, a: int) -> Dict[Client, Points]:
+        clients = self._clients
+        return {clients[b]: v for b, v in self._rows[a].items()}
+
+    def total_received(self, a: int) -> Points:
+        return self._received[a]
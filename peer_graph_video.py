@@ -0,0 +1,114 @@
+from multiprocessing.pool import Pool
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import networkx as nx
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+from result_set import ResultSet
+
+"""
+Peer graph videos, one frame per iteration.
+
+Frames are drawn on a matplotlib Agg canvas and its pixel buffer goes straight into the video writer. The nodes,
+labels and legend are created once, every frame only recolors the nodes and replaces the edge segments.
+With more than one process, workers render consecutive ranges of frames and the frames are written in order.
+"""
+
+SIZE = (640, 480)
+FPS = 2
+# frames a worker renders per task
+CHUNK = 16
+
+CLASS_COLORS = (('good', 'g', "Good Citizens"), ('original', 'r', "Free Riders"), ('defector', 'y', "Defectors"))
+
+
+class PeerGraphRenderer:
+    def __init__(self, results: ResultSet):
+        self.results = results
+        self.ids = results.all_ids()
+        self._index = {x: i for i, x in enumerate(self.ids)}
+        positions = nx.circular_layout(self.ids)
+        self._xy = np.array([positions[x] for x in self.ids]).reshape(-1, 2)
+
+        self.figure = Figure(figsize=(SIZE[0] / 100, SIZE[1] / 100), dpi=100)
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_subplot()
+        ax.set_xlim((-1.75, 1.1))
+        ax.set_ylim((-1.1, 1.1))
+        ax.axis("off")
+        self._edges = LineCollection([], colors='k', alpha=0.5, linewidths=1, zorder=1)
+        ax.add_collection(self._edges)
+        self._nodes = ax.scatter(self._xy[:, 0], self._xy[:, 1], s=100, c=[(0., 0., 0., 0.)] * len(self.ids),
+                                 linewidths=0, zorder=2)
+        for x, (px, py) in zip(self.ids, self._xy):
+            ax.text(px, py, str(x), ha='center', va='center', fontsize=12, zorder=3)
+        ax.legend(handles=[Line2D([], [], marker='o', linestyle='', color=color, alpha=0.8, label=label)
+                           for _, color, label in CLASS_COLORS], loc='upper left')
+        self._title = ax.set_title("")
+
+    def frame(self, iteration: int) -> np.ndarray:
+        """ The BGR pixels of one iteration """
+        results = self.results
+        defectors = results.ids(iteration, 'defector')
+        members = {
+            'good': results.ids(iteration, 'good'),
+            'original': np.setdiff1d(results.ids(iteration, 'bad'), defectors),
+            'defector': defectors,
+        }
+        # nodes without an entry this iteration are left out, like they were when only the classes were drawn
+        colors = np.zeros((len(self.ids), 4))
+        for cls, color, _ in CLASS_COLORS:
+            colors[[self._index[x] for x in members[cls].tolist()]] = to_rgba(color, 0.8)
+        self._nodes.set_facecolor(colors)
+
+        # the graph is undirected, each connection is drawn once
+        pairs = {(min(a, b), max(a, b)) for a, b in results.edges(iteration)}
+        self._edges.set_segments([self._xy[[self._index[a], self._index[b]]] for a, b in sorted(pairs)])
+        self._title.set_text(f"{results.metadata['strategy']} Iteration {iteration}")
+
+        self.canvas.draw()
+        return cv2.cvtColor(np.asarray(self.canvas.buffer_rgba()), cv2.COLOR_RGBA2BGR)
+
+
+_worker_renderer: Optional[PeerGraphRenderer] = None
+
+
+def _init_worker(results: ResultSet) -> None:
+    global _worker_renderer
+    _worker_renderer = PeerGraphRenderer(results)
+
+
+def _render_range(frames: Tuple[int, int]) -> List[np.ndarray]:
+    return [_worker_renderer.frame(i) for i in range(*frames)]
+
+
+def frame_ranges(num_frames: int, chunk: int = CHUNK) -> List[Tuple[int, int]]:
+    return [(start, min(start + chunk, num_frames)) for start in range(0, num_frames, chunk)]
+
+
+def render_frames(results: ResultSet, num_frames: int, processes: int = 1) -> Iterator[np.ndarray]:
+    """ Frames 0 to num_frames in order, rendered by that many processes """
+    if processes <= 1:
+        renderer = PeerGraphRenderer(results)
+        for i in range(num_frames):
+            yield renderer.frame(i)
+        return
+    with Pool(processes, initializer=_init_worker, initargs=(results,)) as pool:
+        # imap keeps the ranges in order while later ones are already being rendered
+        for frames in pool.imap(_render_range, frame_ranges(num_frames)):
+            yield from frames
+
+
+def write_video(frames: Iterable[np.ndarray], output: str, fps: int = FPS) -> None:
+    video = cv2.VideoWriter(output, 0, fps, SIZE)
+    try:
+        for frame in frames:
+            video.write(frame)
+    finally:
+        video.release()
@@ -0,0 +1,65 @@
+from collections import defaultdict
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, Optional, TypeVar
+
+"""
+Wall time and call counts per phase of a run.
+
+Model.run times each of its stages once per iteration and the clients time their Strategy hooks on every call.
+Simulation code holds an Optional[Profiler], like the EventRecorder, and calls straight through when it is None.
+Each timed call costs two perf_counter reads and a dict update, which is small next to any hook, so profiling
+can stay on in sweeps. Phases nest: the strategy.* phases are part of the reset and after_reset phases they
+run in, and strategy.choose_next_person is part of strategy.generate_new_peers.
+"""
+
+R = TypeVar('R')
+
+# Model.run, once per run
+INIT_PEERS = 'init_peers'
+# Model.run, once per iteration, the invariant checks three times
+EXCHANGE = 'exchange'
+STATES = 'get_state'
+RESET_VALUES = 'reset_values'
+CHECKS = 'check_invariants'
+BEFORE_RESET = 'before_reset'
+RESET = 'reset'
+AFTER_RESET = 'after_reset'
+# the Strategy hooks, once per client and call
+PRE_GENERATE = 'strategy.pre_generate'
+GENERATE_NEW_PEERS = 'strategy.generate_new_peers'
+CHOOSE_NEXT_PERSON = 'strategy.choose_next_person'
+STRATEGY_AFTER_RESET = 'strategy.after_reset'
+
+
+class Profiler:
+    def __init__(self):
+        self._seconds: Dict[str, float] = defaultdict(float)
+        self._calls: Dict[str, int] = defaultdict(int)
+
+    def add(self, phase: str, seconds: float, calls: int = 1) -> None:
+        self._seconds[phase] += seconds
+        self._calls[phase] += calls
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """ {phase: {'seconds', 'calls'}}, JSON friendly so it can go into the metadata footer """
+        return {k: {'seconds': self._seconds[k], 'calls': self._calls[k]} for k in self._seconds}
+
+
+def timed(profiler: Optional[Profiler], phase: str, f: Callable[..., R], *args: Any) -> R:
+    """ f(*args), counted towards phase """
+    if profiler is None:
+        return f(*args)
+    start = perf_counter()
+    try:
+        return f(*args)
+    finally:
+        profiler.add(phase, perf_counter() - start)
+
+
+def merge(summaries: Iterable[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """ Adds up Profiler.summary()s, e.g. of every run of a strategy """
+    total = Profiler()
+    for summary in summaries:
+        for phase, x in summary.items():
+            total.add(phase, x['seconds'], x['calls'])
+    return total.summary()
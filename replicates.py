@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from math import sqrt, inf
+from statistics import stdev
+from typing import Sequence, Dict, Any, Tuple, Callable
+
+"""
+Adaptive replicates for generations.py.
+
+Every configuration is first run min_replicates times with different seeds. After each round, a configuration
+gets more replicates only while the 95% confidence interval of one of the metrics is wider than the tolerance,
+doubling its count every round up to max_replicates. Both metrics are fractions, so one tolerance fits both:
+    end           the iteration content stopped moving in, relative to the iterations asked for
+    free_riders   the fraction of free riders in the last iteration
+"""
+
+METRICS: Dict[str, Callable[[Dict[str, Any]], float]] = {
+    'end': lambda summary: summary['end'] / summary['iterations'],
+    'free_riders': lambda summary: summary['free_riders'],
+}
+
+# Two sided 95% critical values of Student's t by degrees of freedom, the normal one past the end of the table
+_T95 = ((1, 12.706), (2, 4.303), (3, 3.182), (4, 2.776), (5, 2.571), (6, 2.447), (7, 2.365), (8, 2.306),
+        (9, 2.262), (10, 2.228), (12, 2.179), (15, 2.131), (20, 2.086), (30, 2.042), (60, 2.000))
+
+
+def t_critical(df: int) -> float:
+    if df > _T95[-1][0]:
+        return 1.96
+    # between two entries, the one with fewer degrees of freedom errs on the wide side
+    return [value for d, value in _T95 if d <= df][-1]
+
+
+def half_width(values: Sequence[float]) -> float:
+    """ Half the width of the 95% confidence interval of the mean of values """
+    if len(values) < 2:
+        return inf
+    return t_critical(len(values) - 1) * stdev(values) / sqrt(len(values))
+
+
+@dataclass(frozen=True)
+class ReplicatePolicy:
+    max_replicates: int = 1
+    min_replicates: int = 3
+    tolerance: float = .02
+    metrics: Tuple[str, ...] = ('end', 'free_riders')
+
+    def converged(self, summaries: Sequence[Dict[str, Any]]) -> bool:
+        return all(half_width([METRICS[m](x) for x in summaries]) <= self.tolerance for m in self.metrics)
+
+    def more(self, attempted: int, summaries: Sequence[Dict[str, Any]]) -> int:
+        """ How many more replicates a configuration needs, given how many ran and the summaries of those that worked """
+        first_round = min(self.min_replicates, self.max_replicates)
+        if attempted < first_round:
+            return first_round - attempted
+        if attempted >= self.max_replicates or self.converged(summaries):
+            return 0
+        return min(attempted, self.max_replicates - attempted)
@@ -0,0 +1,103 @@
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+from results_io import COLUMNAR_SUFFIX, ColumnBuilder, load_columnar, stream_results, recorded_iterations
+
+CLASSES = ('all', 'good', 'bad', 'defector')
+
+
+class ResultSet:
+    """
+    One results file grouped by iteration and by class, with the per-iteration aggregates the graphs need.
+
+    Classes: 'good' entries are not free riding, 'bad' ones are, 'defector' is the part of 'bad' that was not
+    already free riding in iteration 0, and 'all' is everything. Every aggregate is an array indexed by iteration
+    with one entry per recorded iteration, iterations without entries count as 0 like they did in get_end.
+    """
+
+    def __init__(self, metadata: Dict[str, Any], columns: Dict[str, np.ndarray], peer_offsets: np.ndarray,
+                 peer_values: np.ndarray):
+        self.metadata = metadata
+        self.num_iterations: int = recorded_iterations(metadata)
+        self.peer_offsets = peer_offsets
+        self.peer_values = peer_values
+
+        # Rows grouped by iteration, rows of iteration i are order[starts[i]:starts[i + 1]]
+        iteration = np.asarray(columns['iteration'], dtype=np.int64)
+        self.order = np.argsort(iteration, kind='stable')
+        self.columns = {k: np.asarray(v)[self.order] for k, v in columns.items()}
+        self.starts = np.searchsorted(self.columns['iteration'], np.arange(self.num_iterations + 1))
+
+        free_rider = self.columns['free_rider'].astype(bool)
+        original_baddies = np.unique(self.columns['id'][free_rider & (self.columns['iteration'] == 0)])
+        self.masks: Dict[str, np.ndarray] = {
+            'all': np.ones(len(free_rider), dtype=bool),
+            'good': ~free_rider,
+            'bad': free_rider,
+            'defector': free_rider & ~np.isin(self.columns['id'], original_baddies),
+        }
+
+        acquired = self.columns['amount_acquired'].astype(np.float64)
+        spent = (self.columns['willing_to_give'] - self.columns['amount_remaining']).astype(np.float64)
+        utility = acquired / metadata['max_down'] - np.where(free_rider, 0, .25 * spent / metadata['max_up'])
+
+        self.counts: Dict[str, np.ndarray] = {}
+        self.mean_acquired: Dict[str, np.ndarray] = {}
+        self.mean_utility: Dict[str, np.ndarray] = {}
+        for cls, mask in self.masks.items():
+            self.counts[cls] = self._per_iteration(mask)
+            self.mean_acquired[cls] = self._mean(mask, acquired)
+            self.mean_utility[cls] = self._mean(mask, utility)
+        self.total_acquired = self._per_iteration(self.masks['all'], acquired)
+
+        zeros = np.flatnonzero(self.total_acquired == 0)
+        self.end: int = int(zeros[0]) + 1 if len(zeros) else self.num_iterations
+
+    def _per_iteration(self, mask: np.ndarray, weights: np.ndarray = None) -> np.ndarray:
+        return np.bincount(self.columns['iteration'][mask], weights=None if weights is None else weights[mask],
+                           minlength=self.num_iterations)[:self.num_iterations]
+
+    def _mean(self, mask: np.ndarray, values: np.ndarray) -> np.ndarray:
+        counts = self._per_iteration(mask)
+        sums = self._per_iteration(mask, values)
+        return np.divide(sums, counts, out=np.zeros(self.num_iterations), where=counts > 0)
+
+    @classmethod
+    def from_path(cls, path: str) -> 'ResultSet':
+        if path.endswith(COLUMNAR_SUFFIX):
+            results = load_columnar(path)
+            return cls(results.metadata, results.columns, results.peer_offsets, results.peer_values)
+        metadata, iterations = stream_results(path)
+        builder = ColumnBuilder()
+        for _, entries in iterations:
+            builder.add(entries)
+        return cls(metadata, builder.columns(), builder.peer_offsets(), builder.peer_values())
+
+    @classmethod
+    def from_data(cls, all_data: Dict[str, Any]) -> 'ResultSet':
+        """ From the {'metadata': ..., 'data': [...]} layout returned by get_data """
+        builder = ColumnBuilder()
+        builder.add(all_data['data'])
+        return cls(all_data['metadata'], builder.columns(), builder.peer_offsets(), builder.peer_values())
+
+    def rows(self, iteration: int, cls: str = 'all') -> np.ndarray:
+        """ Positions (in self.columns order) of the entries of one iteration """
+        start, stop = self.starts[iteration], self.starts[iteration + 1]
+        return np.arange(start, stop)[self.masks[cls][start:stop]]
+
+    def ids(self, iteration: int, cls: str = 'all') -> np.ndarray:
+        return self.columns['id'][self.rows(iteration, cls)]
+
+    def peers(self, position: int) -> np.ndarray:
+        row = self.order[position]
+        return self.peer_values[self.peer_offsets[row]:self.peer_offsets[row + 1]]
+
+    def edges(self, iteration: int) -> Iterator[tuple]:
+        for position in self.rows(iteration):
+            client = int(self.columns['id'][position])
+            for peer in self.peers(position).tolist():
+                yield client, peer
+
+    def all_ids(self) -> List[int]:
+        return sorted(set(self.columns['id'].tolist()) | set(np.asarray(self.peer_values).tolist()))
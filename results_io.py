@@ -0,0 +1,329 @@
+import os
+from array import array
+from json import dumps, loads
+from pathlib import Path
+from sys import argv
+from typing import Any, Dict, IO, Iterable, Iterator, List, Tuple, TextIO, Optional
+
+import numpy as np
+
+from client import Result
+
+"""
+Streaming result files (.jsonl), one JSON document per line:
+    {"metadata": {...}}                  written before the run starts
+    {"iteration": 0, "data": [...]}      one line per iteration, entries as produced by Result.to_json
+    {"footer": {...}}                    written when the run ends, merged into the metadata by readers
+A run that died part way through has no footer, every complete iteration line is still readable.
+
+Columnar result directories (.cols), one .npy file per field plus metadata.json:
+    iteration, id, amount_acquired, amount_remaining, willing_to_give, free_rider    one entry per row
+    peer_offsets, peer_values     CSR layout, the peers of row i are peer_values[peer_offsets[i]:peer_offsets[i + 1]]
+Rows are in iteration order. Readers memory map the arrays, so only the parts that are touched get loaded.
+"""
+
+STREAM_SUFFIX = '.jsonl'
+LEGACY_SUFFIX = '.json'
+COLUMNAR_SUFFIX = '.cols'
+RESULT_SUFFIXES = (STREAM_SUFFIX, LEGACY_SUFFIX, COLUMNAR_SUFFIX)
+
+COLUMNS = {
+    'iteration': np.int32,
+    'id': np.int32,
+    'amount_acquired': np.int32,
+    'amount_remaining': np.int32,
+    'willing_to_give': np.int32,
+    'free_rider': np.bool_,
+}
+
+
+def complete_lines(f: IO) -> Iterator[Any]:
+    """ Lines of f up to the first one without its newline, which is where a crash cut the file short """
+    for line in f:
+        # works for text and binary files alike
+        if line[-1:] not in ('\n', b'\n'):
+            return
+        yield line
+
+
+class ResultWriter:
+    def __init__(self, path: str, metadata: Optional[Dict[str, Any]], iterations: int = 0):
+        if metadata is None:
+            self._file: TextIO = open(path, 'a')
+        else:
+            self._file = open(path, 'w')
+            self._write({'metadata': metadata})
+        self._iterations = iterations
+
+    @classmethod
+    def resume(cls, path: str, iterations: int) -> 'ResultWriter':
+        """ Appends to a stream that already holds its metadata and `iterations` iteration lines, dropping the rest """
+        with open(path, 'rb+') as f:
+            lines = complete_lines(f)
+            # the metadata line, then the iterations to keep
+            for i in range(iterations + 1):
+                if next(lines, None) is None:
+                    raise ValueError(f"{path} holds fewer than {iterations} iterations")
+            f.truncate(f.tell())
+        return cls(path, None, iterations)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        self._file.write(dumps(record))
+        self._file.write('\n')
+
+    def write_entries(self, iteration: int, entries: Iterable[Dict[str, Any]]) -> None:
+        """ Add one iteration worth of entries in the Result.to_json layout """
+        self._write({'iteration': iteration, 'data': list(entries)})
+        self._iterations += 1
+
+    def write_iteration(self, iteration: int, results: Iterable[Result]) -> None:
+        self.write_entries(iteration, (x.to_json(iteration) for x in results))
+
+    def close(self, **footer: Any) -> None:
+        if self._file.closed:
+            return
+        self._write({'footer': dict(footer, completed_iterations=self._iterations)})
+        self._file.close()
+
+    def __enter__(self) -> 'ResultWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            # leave the footer out so readers can tell the run did not finish
+            self._file.close()
+
+
+class ColumnBuilder:
+    """ Collects entries in the Result.to_json layout into compact column buffers """
+
+    def __init__(self):
+        self._columns: Dict[str, array] = {k: array('q') for k in COLUMNS}
+        self._peer_offsets = array('q', [0])
+        self._peer_values = array('q')
+
+    def add(self, entries: Iterable[Dict[str, Any]]) -> None:
+        for entry in entries:
+            for k, column in self._columns.items():
+                column.append(int(entry[k]))
+            self._peer_values.extend(entry['peers'])
+            self._peer_offsets.append(len(self._peer_values))
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {k: np.frombuffer(v, dtype=np.int64).astype(COLUMNS[k]) for k, v in self._columns.items()}
+
+    def peer_offsets(self) -> np.ndarray:
+        return np.frombuffer(self._peer_offsets, dtype=np.int64).copy()
+
+    def peer_values(self) -> np.ndarray:
+        return np.frombuffer(self._peer_values, dtype=np.int64).astype(np.int32)
+
+
+class ColumnarWriter:
+    """ Same interface as ResultWriter, buffers the columns as compact arrays and writes them on close """
+
+    def __init__(self, path: str, metadata: Dict[str, Any]):
+        self._path = path
+        self._metadata = dict(metadata)
+        self._iterations = 0
+        self._builder: Optional[ColumnBuilder] = ColumnBuilder()
+
+    def write_entries(self, iteration: int, entries: Iterable[Dict[str, Any]]) -> None:
+        """ Add one iteration worth of entries in the Result.to_json layout """
+        self._builder.add(entries)
+        self._iterations += 1
+
+    def write_iteration(self, iteration: int, results: Iterable[Result]) -> None:
+        self.write_entries(iteration, (x.to_json(iteration) for x in results))
+
+    def close(self, **footer: Any) -> None:
+        if self._builder is None:
+            return
+        self._metadata.update(footer, completed_iterations=self._iterations)
+        os.makedirs(self._path, exist_ok=True)
+        for k, column in self._builder.columns().items():
+            np.save(os.path.join(self._path, f'{k}.npy'), column)
+        np.save(os.path.join(self._path, 'peer_offsets.npy'), self._builder.peer_offsets())
+        np.save(os.path.join(self._path, 'peer_values.npy'), self._builder.peer_values())
+        with open(os.path.join(self._path, 'metadata.json'), 'w') as f:
+            f.write(dumps(self._metadata))
+        self._builder = None
+
+    def __enter__(self) -> 'ColumnarWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        # unlike the stream there is nothing on disk until close, so keep what we have either way
+        if exc_type is None:
+            self.close()
+        else:
+            self.close(failed=True)
+
+
+class ColumnarResults:
+    def __init__(self, path: str, mmap: bool = True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, 'metadata.json')) as f:
+            self.metadata: Dict[str, Any] = loads(f.read())
+        self.columns: Dict[str, np.ndarray] = {
+            k: np.load(os.path.join(path, f'{k}.npy'), mmap_mode=mode) for k in COLUMNS
+        }
+        self.peer_offsets: np.ndarray = np.load(os.path.join(path, 'peer_offsets.npy'), mmap_mode=mode)
+        self.peer_values: np.ndarray = np.load(os.path.join(path, 'peer_values.npy'), mmap_mode=mode)
+
+    def __len__(self) -> int:
+        return len(self.columns['iteration'])
+
+    def peers(self, row: int) -> np.ndarray:
+        return self.peer_values[self.peer_offsets[row]:self.peer_offsets[row + 1]]
+
+    def entries(self, start: int = 0, stop: int = None) -> Iterator[Dict[str, Any]]:
+        """ Rows start..stop in the Result.to_json layout """
+        stop = len(self) if stop is None else stop
+        columns = {k: v[start:stop].tolist() for k, v in self.columns.items()}
+        offsets = self.peer_offsets[start:stop + 1].tolist()
+        values = self.peer_values[offsets[0]:offsets[-1]].tolist()
+        for i in range(stop - start):
+            entry = {k: v[i] for k, v in columns.items()}
+            entry['peers'] = values[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]]
+            yield entry
+
+    def iterations(self) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        iteration = np.asarray(self.columns['iteration'])
+        bounds = np.flatnonzero(np.diff(iteration)) + 1
+        starts = np.r_[0, bounds] if len(iteration) else np.array([], dtype=np.int64)
+        stops = np.r_[bounds, len(iteration)] if len(iteration) else starts
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            yield int(iteration[start]), list(self.entries(start, stop))
+
+
+def load_columnar(path: str, mmap: bool = True) -> ColumnarResults:
+    return ColumnarResults(path, mmap)
+
+
+def recorded_iterations(metadata: Dict[str, Any]) -> int:
+    """ How many iterations a run meant to record, fewer than requested when it stopped early on convergence """
+    if 'stopped_at' in metadata:
+        return metadata['stopped_at'] + 1
+    return metadata['iterations']
+
+
+def finished(path: str, metadata: Dict[str, Any]) -> bool:
+    """ Whether a run ran to its end, from its metadata with the footer merged in. Legacy .json files always did """
+    if path.endswith(LEGACY_SUFFIX):
+        return True
+    return 'completed_iterations' in metadata and not metadata.get('failed', False)
+
+
+def read_metadata(path: str) -> Dict[str, Any]:
+    """ The metadata a results file was started with, without reading its iterations """
+    if path.endswith(COLUMNAR_SUFFIX):
+        with open(os.path.join(path, 'metadata.json')) as f:
+            return loads(f.read())
+    with open(path) as f:
+        if path.endswith(STREAM_SUFFIX):
+            return loads(f.readline())['metadata']
+        return loads(f.read())['metadata']
+
+
+def stream_results(path: str) -> Tuple[Dict[str, Any], Iterator[Tuple[int, List[Dict[str, Any]]]]]:
+    """
+    Metadata of a results file plus an iterator over (iteration, entries).
+
+    .jsonl files are read one line at a time, the footer is merged into the returned metadata dict once the
+    iterator is exhausted. .cols directories are memory mapped. Legacy .json files have to be loaded whole.
+    """
+    if path.endswith(COLUMNAR_SUFFIX):
+        results = load_columnar(path)
+        return results.metadata, results.iterations()
+
+    if not path.endswith(STREAM_SUFFIX):
+        with open(path) as f:
+            all_data = loads(f.read())
+        by_iteration: Dict[int, List[Dict[str, Any]]] = {}
+        for x in all_data['data']:
+            by_iteration.setdefault(x['iteration'], []).append(x)
+        return all_data['metadata'], iter(sorted(by_iteration.items()))
+
+    f = open(path)
+    metadata = loads(f.readline())['metadata']
+
+    def iterations():
+        with f:
+            # a run killed while writing leaves a partial last line, everything before it is still good
+            for line in complete_lines(f):
+                record = loads(line)
+                if 'footer' in record:
+                    metadata.update(record['footer'])
+                else:
+                    yield record['iteration'], record['data']
+
+    return metadata, iterations()
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """ Whole results file in the legacy {'metadata': ..., 'data': [...]} layout """
+    if path.endswith(LEGACY_SUFFIX):
+        with open(path) as f:
+            return loads(f.read())
+    metadata, iterations = stream_results(path)
+    data = [x for _, entries in iterations for x in entries]
+    return {'metadata': metadata, 'data': data}
+
+
+def to_columnar(path: str) -> str:
+    """ Convert a .json or .jsonl results file into a .cols directory next to it, returns the new path """
+    if path.endswith(COLUMNAR_SUFFIX):
+        raise ValueError(f"{path} is already columnar")
+    target = str(Path(path).with_suffix(COLUMNAR_SUFFIX))
+    metadata, iterations = stream_results(path)
+    writer = ColumnarWriter(target, metadata)
+    for iteration, entries in iterations:
+        writer.write_entries(iteration, entries)
+    # the footer only shows up in metadata once the stream is exhausted
+    footer = {k: v for k, v in metadata.items() if k != 'completed_iterations'}
+    # a run without its footer has to stay recognisable as one that did not finish
+    if not finished(path, metadata):
+        footer['failed'] = True
+    writer.close(**footer)
+    return target
+
+
+def to_stream(path: str) -> str:
+    """ Convert a .cols directory or legacy .json file into a .jsonl file next to it, returns the new path """
+    if path.endswith(STREAM_SUFFIX):
+        raise ValueError(f"{path} is already a stream")
+    target = str(Path(path).with_suffix(STREAM_SUFFIX))
+    metadata, iterations = stream_results(path)
+    complete = finished(path, metadata)
+    metadata = dict(metadata)
+    metadata.pop('completed_iterations', None)
+    written = 0
+    with open(target, 'w') as f:
+        f.write(dumps({'metadata': metadata}) + '\n')
+        for iteration, entries in iterations:
+            f.write(dumps({'iteration': iteration, 'data': entries}) + '\n')
+            written += 1
+        # like ResultWriter, only a run that finished gets a footer
+        if complete:
+            f.write(dumps({'footer': {'completed_iterations': written}}) + '\n')
+    return target
+
+
+if __name__ == '__main__':
+    try:
+        cmd = argv[1]
+        paths = argv[2:]
+        convert = {
+            'to-columnar': to_columnar,
+            'to-jsonl': to_stream
+        }[cmd]
+        for p in paths:
+            print(convert(p))
+    except (IndexError, KeyError):
+        print(f"usage: {argv[0]} to-columnar|to-jsonl path/to/results...")
@@ -0,0 +1,151 @@
+import os
+from collections import defaultdict
+from multiprocessing.pool import Pool
+from statistics import median
+from time import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, TypeVar
+
+"""
+Largest-first scheduling for generations.py.
+
+Tasks are (strategy, iterations, #good, #bad, peer_size, max_up, max_down) tuples. Their cost is estimated from
+those parameters, then calibrated per strategy against the run times the manifest recorded for earlier sweeps.
+Jobs are sorted by cost, largest first, and cut into batches: expensive tasks go out one at a time while cheap
+ones are bundled together, so workers don't idle at the end of a sweep behind one straggler and don't pay
+a round trip per tiny task either.
+"""
+
+J = TypeVar('J')
+R = TypeVar('R')
+
+# Relative per-unit cost of each strategy's reset phase compared to NoStrategy
+STRATEGY_WEIGHTS = {
+    'NoStrategy': 1.,
+    'RandomStrategy': 1.,
+    'DropZeros': 1.2,
+    'OptimisticUnchoking': 2.,
+    'DemeritChoking': 2.5,
+    'GainValueUnchoking': 3.,
+}
+
+# Memory of a worker process before it runs anything
+BASE_WORKER_MEMORY = 80 * 1024 * 1024
+
+
+def task_params(t: Sequence[Any]) -> List[Any]:
+    """ JSON friendly form of a task, as recorded in the manifest """
+    return [t[0].__name__, *t[1:]]
+
+
+def estimate_cost(params: Sequence[Any]) -> float:
+    """ Rough relative cost of a task from its parameters """
+    strategy, iterations, num_good, num_bad, peer_size, max_up, max_down = params
+    agents = num_good + num_bad
+    # Model.exchange makes one pass per unit an agent gets, up to what its peers can upload
+    passes = min(max_down, peer_size * max_up)
+    return STRATEGY_WEIGHTS.get(strategy, 1.) * iterations * agents * (passes + peer_size)
+
+
+def estimate_memory(params: Sequence[Any]) -> int:
+    """ Rough peak bytes of a worker running a task """
+    strategy, iterations, num_good, num_bad, peer_size, max_up, max_down = params
+    agents = num_good + num_bad
+    if strategy in ('OptimisticUnchoking', 'GainValueUnchoking', 'DemeritChoking'):
+        # contribution history, a window of a few iterations plus aggregates per peer ever unchoked
+        return BASE_WORKER_MEMORY + agents * agents * 256
+    return BASE_WORKER_MEMORY + agents * peer_size * 1024
+
+
+class CostModel:
+    """ estimate_cost scaled to seconds with what earlier sweeps took """
+
+    def __init__(self, records: Iterable[Dict[str, Any]]):
+        ratios: Dict[str, List[float]] = defaultdict(list)
+        self._measured: Dict[Tuple[Any, ...], float] = {}
+        for record in records:
+            if 'seconds' not in record or 'params' not in record:
+                continue
+            params = tuple(record['params'])
+            self._measured[params] = record['seconds']
+            ratios[params[0]].append(record['seconds'] / estimate_cost(params))
+        all_ratios = [x for v in ratios.values() for x in v]
+        self._default_scale = median(all_ratios) if all_ratios else 1.
+        self._scale = {k: median(v) for k, v in ratios.items()}
+
+    def cost(self, params: Sequence[Any]) -> float:
+        params = tuple(params)
+        if params in self._measured:
+            return self._measured[params]
+        return estimate_cost(params) * self._scale.get(params[0], self._default_scale)
+
+
+def worker_count(params: Iterable[Sequence[Any]], memory_budget_mb: int = 0) -> int:
+    """ As many workers as there are CPUs, fewer if the biggest task times that wouldn't fit the budget """
+    processes = os.cpu_count() or 1
+    if memory_budget_mb:
+        biggest = max((estimate_memory(x) for x in params), default=BASE_WORKER_MEMORY)
+        processes = min(processes, max(1, memory_budget_mb * 1024 * 1024 // biggest))
+    return processes
+
+
+def make_batches(jobs: Sequence[J], costs: Sequence[float], processes: int) -> List[Tuple[List[J], float]]:
+    """ Jobs largest first, bundled so that no batch costs more than a fraction of a worker's share """
+    order = sorted(range(len(jobs)), key=lambda i: costs[i], reverse=True)
+    target = sum(costs) / (processes * 8) if jobs else 0
+    batches: List[Tuple[List[J], float]] = []
+    current: List[J] = []
+    current_cost = 0.
+    for i in order:
+        if current and current_cost + costs[i] > target:
+            batches.append((current, current_cost))
+            current, current_cost = [], 0.
+        current.append(jobs[i])
+        current_cost += costs[i]
+    if current:
+        batches.append((current, current_cost))
+    return batches
+
+
+class Progress:
+    def __init__(self, total_tasks: int, total_cost: float, every: float = 10.):
+        self._total_tasks = total_tasks
+        self._total_cost = total_cost
+        self._every = every
+        self._start = time()
+        self._last_report = 0.
+        self.tasks = 0
+        self.cost = 0.
+
+    def update(self, tasks: int, cost: float) -> None:
+        self.tasks += tasks
+        self.cost += cost
+        now = time()
+        if now - self._last_report >= self._every or self.tasks == self._total_tasks:
+            self._last_report = now
+            print(self.report(now))
+
+    def report(self, now: float) -> str:
+        elapsed = now - self._start
+        rate = self.tasks / elapsed if elapsed else 0.
+        # the cost estimates, not the task count, say how much work is left
+        eta = elapsed * (self._total_cost - self.cost) / self.cost if self.cost else float('nan')
+        return f"{self.tasks}/{self._total_tasks} tasks, {rate:.2f} tasks/s, {elapsed:.0f}s elapsed, ETA {eta:.0f}s"
+
+
+def run_scheduled(fn: Callable[[J], R], jobs: Sequence[J], costs: Sequence[float], processes: int,
+                  progress_every: float = 10.) -> Iterator[Tuple[J, R]]:
+    """ fn over every job on a pool of processes, largest first, yielding (job, result) as they finish """
+    batches = make_batches(jobs, costs, processes)
+    progress = Progress(len(jobs), sum(costs), progress_every)
+    batch_costs = [cost for _, cost in batches]
+    with Pool(processes) as p:
+        # imap_unordered still hands the batches out in order, so the largest start first
+        results = p.imap_unordered(_run_batch, ((fn, i, batch) for i, (batch, _) in enumerate(batches)))
+        for i, done in results:
+            progress.update(len(done), batch_costs[i])
+            yield from done
+
+
+def _run_batch(args: Tuple[Callable[[J], R], int, List[J]]) -> Tuple[int, List[Tuple[J, R]]]:
+    fn, i, batch = args
+    return i, [(job, fn(job)) for job in batch]
@@ -1,10 +1,15 @@
 from abc import ABC, abstractmethod
 from collections import defaultdict
+from heapq import heapify, heappop
 from itertools import chain
-from typing import TYPE_CHECKING, Iterator, Mapping, Dict, Collection, List, Optional, Set, Tuple
+from math import isnan
+from typing import TYPE_CHECKING, Iterator, Mapping, Dict, Collection, Optional, Set, Tuple
 
 import numpy as np
 
+from contribution_history import ContributionHistory, FrequentGivers
+from profiler import timed, CHOOSE_NEXT_PERSON
+
 if TYPE_CHECKING:
     from client import Client
     from swarm import Swarm
@@ -24,8 +29,7 @@ class Strategy(ABC):
             new_peers = list(
                 self._swarm.get_random_grouping(num_peers - len(current_peers), current_peers, self._client))
         for peer in new_peers:
-            self._client.add_peer(peer)
-            peer.add_peer(self._client)
+            self._client.connect(peer)
             yield peer
         yield from current_peers
 
@@ -39,14 +43,15 @@ class Strategy(ABC):
         Set['Client'], Set['Client']]:
         to_remove = []
         for peer in old_peers.keys():
-            if self._client not in peer.peers:
+            if not peer.has_peer(self._client):
                 to_remove.append(peer)
         for peer in self._client.peers:
-            if self._client not in peer.peers:
+            if not peer.has_peer(self._client):
                 self._client.remove_peer(peer)
         for removed in to_remove:
             del old_peers[removed]
-        clients_connecting_to_us = {x for x in self._swarm.all_clients() if self._client in x.peers}
+        # in slot order, the order scanning the whole swarm used to add them in
+        clients_connecting_to_us = set(self._client.inbound_peers)
         # return the new clients
         return clients_connecting_to_us - set(old_peers.keys()), set(to_remove)
 
@@ -71,8 +76,7 @@ class RandomStrategy(Strategy):
         for peer in old_peers.keys():
             self._client.remove_peer(peer)
         for peer in self._swarm.swap_bad_clients(self._client, old_peers, ()):
-            self._client.add_peer(peer)
-            peer.add_peer(self._client)
+            self._client.connect(peer)
             yield peer
         yield from new_peers
 
@@ -85,28 +89,19 @@ class DropZeros(Strategy):
         bad = [p for p, v in old_peers.items() if v == 0 and p not in removed_in_iteration]
 
         for peer in bad:
-            self._client.remove_peer(peer)
-            peer.remove_peer(self._client)
+            self._client.disconnect(peer)
 
         new = list(self._swarm.swap_bad_clients(self._client, bad, keep + list(removed_in_iteration)))
         for peer in new:
-            self._client.add_peer(peer)
-            peer.add_peer(self._client)
+            self._client.connect(peer)
         yield from keep
         yield from new
 
 
-class HistEntry:
-    def __init__(self, iterations, added):
-        self.contributions: List[int] = [0] * iterations
-        self.added: int = added
-
-    def __repr__(self):
-        return f'{self.contributions}, {self.added}'
-
-
 class OptimisticUnchoking(Strategy):
     timeout = 3
+    # How many iterations of contributions, the current one included, the strategy ever looks at
+    lookback = timeout
 
     def __init__(self, swarm: 'Swarm', client: 'Client', iterations: int):
         super().__init__(swarm, client, iterations)
@@ -114,7 +109,7 @@ class OptimisticUnchoking(Strategy):
         self._is_choked: Dict[Client, bool] = {}
         self._current_round = 0
         self._max_iterations = iterations
-        self._historic_contributions: Dict[Client, HistEntry] = {}
+        self._historic_contributions: ContributionHistory[Client] = ContributionHistory(self.lookback)
 
     def willing_to_give_to(self, client: 'Client') -> bool:
         if client in self._is_choked:
@@ -126,22 +121,23 @@ class OptimisticUnchoking(Strategy):
         return self._swarm.get_one_random(set(chain(current_peers, blacklist)), self._client)
 
     def choke(self, peer: 'Client', remove=True):
-        print(f"{self._client} choking {peer}")
+        if self._swarm.recorder is not None:
+            self._swarm.recorder.choke(self._client.id, peer.id)
         self._is_choked[peer] = True
         if remove:
-            self._client.remove_peer(peer)
-            peer.remove_peer(self._client)
+            self._client.disconnect(peer)
 
     def unchoke(self, peer: 'Client', current_iteration: int, add: bool = True) -> None:
-        print(f"{self._client} un_choking {peer}")
+        if self._swarm.recorder is not None:
+            self._swarm.recorder.unchoke(self._client.id, peer.id)
         self._is_choked[peer] = False
         self._times_unchoked[peer] += 1
         if peer not in self._historic_contributions:
-            self._historic_contributions[peer] = HistEntry(self._max_iterations, current_iteration)
-        self._historic_contributions[peer].added = current_iteration
+            self._historic_contributions.add(peer, current_iteration)
+        else:
+            self._historic_contributions.restart(peer, current_iteration)
         if add:
-            self._client.add_peer(peer)
-            peer.add_peer(self._client)
+            self._client.connect(peer)
 
     def init_peers(self, num_peers: int) -> Iterator['Client']:
         new_peers = list(super().init_peers(num_peers))
@@ -157,7 +153,7 @@ class OptimisticUnchoking(Strategy):
         Set['Client'], Set['Client']]:
         # Save contributions from this round
         for peer in list(old_peers.keys()):
-            self._historic_contributions[peer].contributions[current_iteration] = old_peers[peer]
+            self._historic_contributions.record(peer, current_iteration, old_peers[peer])
         return super().pre_generate(old_peers, current_iteration)
 
     @property
@@ -169,11 +165,10 @@ class OptimisticUnchoking(Strategy):
         # choke the guys that suck, but only the first one
         newly_choked = set()
         for peer in old_peers.keys():
-            hc = self._historic_contributions[peer]
-
-            if hc.added <= (current_iteration - self.timeout):
+            if self._historic_contributions.added(peer) <= (current_iteration - self.timeout):
                 # If we did not get any contributions in the last {timeout} rounds
-                recent_contributions = hc.contributions[current_iteration - self.timeout + 1:current_iteration + 1]
+                recent_contributions = self._historic_contributions.recent(
+                    peer, current_iteration - self.timeout + 1, current_iteration + 1)
                 if all(x == 0 for x in recent_contributions):
                     self.choke(peer)
                     newly_choked = {peer}
@@ -183,7 +178,8 @@ class OptimisticUnchoking(Strategy):
         # If we want more people, try to find more people
         current_peers = set((old_peers.keys() | new_peers) - removed_in_iteration) - self.choked
         if len(current_peers) < self._client.peer_size:
-            new = self.choose_next_person(current_peers, removed_in_iteration | newly_choked, current_iteration)
+            new = timed(self._swarm.profiler, CHOOSE_NEXT_PERSON, self.choose_next_person, current_peers,
+                        removed_in_iteration | newly_choked, current_iteration)
             if new is not None:
                 self.unchoke(new, current_iteration, add=new not in new_peers)
                 current_peers.add(new)
@@ -192,29 +188,42 @@ class OptimisticUnchoking(Strategy):
     def after_reset(self, current_iteration: int):
         for peer in self._client.peers:
             if peer not in self._historic_contributions:
-                self._historic_contributions[peer] = HistEntry(self._max_iterations, current_iteration)
+                self._historic_contributions.add(peer, current_iteration)
 
 
 class GainValueUnchoking(OptimisticUnchoking):
 
+    def __init__(self, swarm: 'Swarm', client: 'Client', iterations: int):
+        super().__init__(swarm, client, iterations)
+        # (iteration, Umax), dropped whenever a contribution or an unchoke could change it
+        self._umax: Optional[Tuple[int, float]] = None
+
     def _N(self, j: 'Client') -> int:
         return self._times_unchoked[j]
 
     def _n(self, j: 'Client') -> int:
         if j in self._historic_contributions:
-            return sum(1 for x in self._historic_contributions[j].contributions if x != 0)
+            return self._historic_contributions.nonzero(j)
         return 0
 
     def _u(self, j: 'Client', current_iteration: int) -> float:
-        if j not in self._historic_contributions:
+        history = self._historic_contributions
+        if j not in history:
             return 0
-        if self._historic_contributions[j].added >= current_iteration:
+        added = history.added(j)
+        if added >= current_iteration:
             return 0
-        return np.mean(
-            self._historic_contributions[j].contributions[self._historic_contributions[j].added:current_iteration])
+        # Contributions are only ever recorded up to the current iteration, which the average leaves out.
+        # np.float64 like np.mean returned, so a peer never unchoked still divides to inf or nan in _G
+        return np.float64(history.since_added(j) - history.get(j, current_iteration)) / (current_iteration - added)
 
     def _Umax(self, current_iteration: int) -> float:
-        return max(self._u(x, current_iteration) for x in self.neighbors)
+        if self._umax is None or self._umax[0] != current_iteration:
+            # only peers with history can have a non zero average
+            self._umax = (current_iteration, max(chain(
+                (self._u(x, current_iteration) for x in self._historic_contributions if x is not self._client),
+                (0,))))
+        return self._umax[1]
 
     def _G(self, j: 'Client', current_iteration: int):
         if self._n(j) > 0:
@@ -222,13 +231,28 @@ class GainValueUnchoking(OptimisticUnchoking):
         else:
             return self._Umax(current_iteration) / (self._N(j) + 1)
 
+    def pre_generate(self, old_peers: Dict['Client', int], current_iteration: int) -> Tuple[
+        Set['Client'], Set['Client']]:
+        self._umax = None
+        return super().pre_generate(old_peers, current_iteration)
+
+    def unchoke(self, peer: 'Client', current_iteration: int, add: bool = True) -> None:
+        self._umax = None
+        super().unchoke(peer, current_iteration, add)
+
     def choose_next_person(self, current_peers: Collection['Client'], blacklist: Collection['Client'],
                            current_iteration) -> 'Client':
+        # Position in self.neighbors breaks ties, the way the stable sort over them always did
+        g_values = [(self._G(x, current_iteration), i, x) for i, x in enumerate(self.neighbors)]
+        if any(isnan(g) for g, _, _ in g_values):
+            # nan doesn't order, only sorted() itself picks the same peer sorted() always picked
+            ordered: Iterator['Client'] = (x for _, _, x in sorted(g_values, key=lambda v: v[0]))
+        else:
+            heapify(g_values)
+            ordered = (heappop(g_values)[2] for _ in range(len(g_values)))
 
         def gen():
-            g_values = {x: self._G(x, current_iteration) for x in self.neighbors}
-            sorted_g_values = sorted(g_values.items(), key=lambda kv: kv[1])
-            for k, _ in sorted_g_values:
+            for k in ordered:
                 if k.is_saturated:
                     continue
                 if k in current_peers:
@@ -242,16 +266,29 @@ class GainValueUnchoking(OptimisticUnchoking):
 
 class DemeritChoking(OptimisticUnchoking):
     # timeout = 6 iterations
+    window = 6
+    times_given = 4
+    # the window before the current iteration, and the current one
+    lookback = window + 1
+
+    def __init__(self, swarm: 'Swarm', client: 'Client', iterations: int):
+        super().__init__(swarm, client, iterations)
+        self._frequent_givers: FrequentGivers[Client] = FrequentGivers(self.window, self.times_given)
+
+    def pre_generate(self, old_peers: Dict['Client', int], current_iteration: int) -> Tuple[
+        Set['Client'], Set['Client']]:
+        for peer, amount in old_peers.items():
+            self._frequent_givers.record(peer, current_iteration, amount)
+        return super().pre_generate(old_peers, current_iteration)
+
     def choose_next_person(self, current_peers: Collection['Client'], blacklist: Collection['Client'],
                            current_iteration) -> Optional['Client']:
-        if current_iteration < 6:
+        if current_iteration < self.window:
             return None
 
         def gen():
-            for peer, hc in self._historic_contributions.items():
-                num_times_given = sum(1 for x in hc.contributions[current_iteration - 6: current_iteration] if x != 0)
-                if num_times_given < 4:
-                    continue
+            # the frequent givers in the order they were first unchoked, like walking the whole history did
+            for peer in sorted(self._frequent_givers.at(current_iteration), key=self._historic_contributions.row):
                 if peer.is_saturated:
                     continue
                 if peer in current_peers:
@@ -260,6 +297,4 @@ class DemeritChoking(OptimisticUnchoking):
                     continue
                 yield peer
 
-
         return next(gen(), None)
-
@@ -0,0 +1,115 @@
+import sqlite3
+from json import dumps, loads
+from multiprocessing.pool import Pool
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from parse_data_file import stream_summary
+from results_io import RESULT_SUFFIXES
+from sweep_cache import MANIFEST
+
+"""
+A sidecar SQLite index of the result files in a folder, so folder level queries don't parse every file.
+
+Every result file gets a row with its metadata (footer included), its end iteration and the fraction of free
+riders it ended with, keyed by file name. The row remembers the size and mtime the file had when it was parsed,
+and a refresh only parses files that are new or changed since, in parallel, and drops the rows of files that are
+gone or can no longer be read.
+
+Runs without a footer, crashed or waiting to be resumed, are indexed as partial. runs() leaves them out so they
+never count towards an aggregate, partial_runs() lists them.
+"""
+
+INDEX = 'summary.sqlite'
+# bumped whenever the columns change, an index with another version is rebuilt from scratch
+SCHEMA_VERSION = 2
+SUMMARY_COLUMNS = ('end', 'free_riders')
+
+Signature = Tuple[int, int]
+
+
+def signature(path: Path) -> Signature:
+    """ (mtime_ns, size) of a file, or of the newest file and total size of a .cols directory """
+    if path.is_dir():
+        stats = [x.stat() for x in path.iterdir()]
+        return max((x.st_mtime_ns for x in stats), default=0), sum(x.st_size for x in stats)
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+def result_files(folder: Path) -> Iterator[Path]:
+    for child in folder.iterdir():
+        if child.suffix in RESULT_SUFFIXES and child.name != MANIFEST:
+            yield child
+
+
+def summarize(path: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Metadata and summary of one file. A run that crashed or is still being written is summarized as far as it got,
+    None only when not even its metadata can be read
+    """
+    try:
+        return stream_summary(path)
+    except Exception as e:
+        print(f"could not index {path}: {e!r}")
+        return None
+
+
+class SummaryIndex:
+    def __init__(self, results_folder: str):
+        self.folder = Path(results_folder)
+        self._db = sqlite3.connect(str(self.folder / INDEX))
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS runs")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS runs ("
+                         "name TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, metadata TEXT, "
+                         "end INTEGER, free_riders REAL, complete INTEGER)")
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> 'SummaryIndex':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def refresh(self, processes: Optional[int] = None) -> int:
+        """ Bring the index up to date with the folder, returns how many rows were added, updated or dropped """
+        known: Dict[str, Signature] = {name: (mtime, size) for name, mtime, size
+                                       in self._db.execute("SELECT name, mtime_ns, size FROM runs")}
+        current = {x.name: signature(x) for x in result_files(self.folder)}
+        stale = sorted(name for name, sig in current.items() if known.get(name) != sig)
+
+        gone = [(name,) for name in known if name not in current]
+        self._db.executemany("DELETE FROM runs WHERE name = ?", gone)
+
+        paths = [str(self.folder / name) for name in stale]
+        if len(paths) > 1 and processes != 1:
+            with Pool(processes) as pool:
+                summaries: List[Optional[Tuple[Dict[str, Any], Dict[str, Any]]]] = pool.map(summarize, paths)
+        else:
+            summaries = [summarize(x) for x in paths]
+
+        # a file that changed into something unreadable must not keep the row of what it was
+        self._db.executemany("DELETE FROM runs WHERE name = ?",
+                             [(name,) for name, summary in zip(stale, summaries) if summary is None])
+        self._db.executemany(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(name, *current[name], dumps(summary[0]), *(summary[1][k] for k in SUMMARY_COLUMNS),
+              summary[1]['complete'])
+             for name, summary in zip(stale, summaries) if summary is not None])
+        self._db.commit()
+        return len(stale) + len(gone)
+
+    def runs(self) -> Iterator[Tuple[str, Dict[str, Any], Dict[str, Any]]]:
+        """ (file name, metadata, summary) of every indexed run that finished """
+        for name, metadata, *summary in self._db.execute(
+                f"SELECT name, metadata, {', '.join(SUMMARY_COLUMNS)} FROM runs WHERE complete ORDER BY name"):
+            yield name, loads(metadata), dict(zip(SUMMARY_COLUMNS, summary))
+
+    def partial_runs(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """ (file name, metadata) of every indexed run without a footer """
+        for name, metadata in self._db.execute("SELECT name, metadata FROM runs WHERE NOT complete ORDER BY name"):
+            yield name, loads(metadata)
@@ -1,34 +1,54 @@
-from random import sample
+from random import Random, getrandbits
 from typing import Set, Iterator, Collection, Optional
 
 from client import Client
+from events import EventRecorder
+from peer_graph import PeerGraph
+from profiler import Profiler
+from utils import IndexedSet
 
 
 class Swarm:
-    def __init__(self):
+    def __init__(self, recorder: Optional[EventRecorder] = None, rng: Optional[Random] = None,
+                 profiler: Optional[Profiler] = None):
         self._clients: Set[Client] = set()
+        # Every random choice made for this swarm comes from here, so a run only depends on its own seed
+        self.rng = rng if rng is not None else Random(getrandbits(64))
+        # Ids are numbered per swarm, so set orders and results don't depend on what else the process ran.
+        # A plain counter rather than itertools.count so snapshots of the swarm can be pickled
+        self._next_id = 0
+        self.recorder = recorder
+        self.profiler = profiler
+        self.peer_graph = PeerGraph(recorder)
+        # Clients that can still take more peers, kept up to date by Client whenever its peers change
+        self._unsaturated: IndexedSet[Client] = IndexedSet()
 
     def all_clients(self) -> Collection[Client]:
         return self._clients
 
+    def next_id(self) -> int:
+        self._next_id += 1
+        return self._next_id - 1
+
     def join(self, client: Client) -> None:
         self._clients.add(client)
+        self.update_saturation(client)
 
-    @property
-    def saturated_clients(self) -> Collection[Client]:
-        return [x for x in self._clients if x.is_saturated]
+    def update_saturation(self, client: Client) -> None:
+        if client not in self._clients:
+            return
+        if client.is_saturated:
+            self._unsaturated.discard(client)
+        else:
+            self._unsaturated.add(client)
 
     def swap_bad_clients(self, me: Client, clients: Collection[Client], ignore: Collection[Client]):
         yield from self.get_random_grouping(len(clients), set(clients) | set(ignore), me)
 
     def get_random_grouping(self, n: int, ignore: Collection[Client], requestor: Client) -> Iterator[Client]:
-        possible_agents = self._clients - (set(ignore) | {requestor}) - set(self.saturated_clients)
-        if len(possible_agents) <= n:
-            grouping = possible_agents
-        else:
-            grouping = sample(possible_agents, n)
-        for peer in grouping:
-            yield peer
+        exclude = set(ignore)
+        exclude.add(requestor)
+        yield from self._unsaturated.sample(n, exclude, self.rng)
 
     def get_one_random(self, ignore: Collection[Client], requestor: Client) -> Optional[Client]:
         return next(self.get_random_grouping(1, ignore, requestor), None)
@@ -0,0 +1,92 @@
+import inspect
+import os
+from hashlib import sha256
+from json import dumps, loads
+from time import time
+from typing import Any, Dict, Tuple, Type
+
+from results_io import read_metadata
+from strategies import Strategy
+
+"""
+Bookkeeping that lets generations.py skip work it already did.
+
+Every task gets a key hashed from its parameters, the source of its strategy class (and of the strategy classes it
+inherits from), the seed and the options that change its output. The manifest is an append-only journal of
+{"key", "status", ...} lines in the results folder, the last line for a key wins:
+    in_flight     written by the worker when it starts the task
+    completed     written once the output file is closed
+    failed        written when the task raised
+A task is skipped when its key is completed and its output is still there, written under that same key. Outputs
+are named after the task alone, so a sweep with other options overwrites them, and the key in the output's
+metadata tells whose they are. Event traces don't change the results and aren't part of the key, a sweep that
+asks for them only skips tasks whose completed record names a trace that is still there. Anything else,
+including tasks that were in flight when a sweep died, is run again.
+"""
+
+MANIFEST = 'manifest.jsonl'
+
+COMPLETED = 'completed'
+FAILED = 'failed'
+IN_FLIGHT = 'in_flight'
+
+
+def strategy_source(strategy: Type[Strategy]) -> str:
+    return ''.join(inspect.getsource(x) for x in strategy.__mro__ if issubclass(x, Strategy))
+
+
+def task_seed(task: Tuple[Any, ...], base_seed: int, replicate: int = 0) -> int:
+    """ Seed of one replicate of a task, from its parameters only so editing a strategy doesn't reshuffle its runs """
+    h = sha256(dumps([base_seed, task[0].__name__, *task[1:], replicate]).encode())
+    return int.from_bytes(h.digest()[:8], 'big')
+
+
+def task_key(task: Tuple[Any, ...], seed: int, options: Dict[str, Any]) -> str:
+    strategy = task[0]
+    h = sha256()
+    h.update(dumps([strategy.__name__, *task[1:]]).encode())
+    h.update(strategy_source(strategy).encode())
+    h.update(dumps(seed).encode())
+    h.update(dumps(options, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class Manifest:
+    def __init__(self, results_folder: str):
+        self.path = os.path.join(results_folder, MANIFEST)
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """ Latest record for every key """
+        records: Dict[str, Dict[str, Any]] = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = loads(line)
+                except ValueError:
+                    # a line cut short by a crash
+                    continue
+                records[record['key']] = record
+        return records
+
+    def record(self, key: str, status: str, **info: Any) -> None:
+        line = (dumps(dict(info, key=key, status=status, time=time())) + '\n').encode()
+        # a single O_APPEND write per line, so concurrent workers don't interleave their records
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def is_done(self, records: Dict[str, Dict[str, Any]], key: str, events: bool = False) -> bool:
+        record = records.get(key)
+        if record is None or record['status'] != COMPLETED:
+            return False
+        if events and not os.path.exists(record.get('events', '')):
+            return False
+        try:
+            return read_metadata(record['output']).get('cache_key') == key
+        except (OSError, ValueError, KeyError):
+            # gone, or not even the metadata made it to disk
+            return False
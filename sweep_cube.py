@@ -0,0 +1,154 @@
+from hashlib import sha1
+from json import dumps
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from results_io import RESULT_SUFFIXES
+from summary_index import SummaryIndex, SUMMARY_COLUMNS
+
+"""
+Every run of a sweep in one dense array, with an axis per sweep parameter and a last axis per metric.
+
+The cube is built from the summary indexes of the results folder and its strategy sub folders and saved as
+sweep_cube.npz in the results folder. Building it refreshes the indexes first and keeps a key of the runs it was
+built from, so it is rebuilt exactly when a run was added, changed or removed. Replicates of a configuration are
+summed into `totals` and counted in `runs`, so averaging over any set of axes weighs every run the same.
+Configurations nothing ran for have no runs and show up as nan. Runs that did not finish never go into the totals,
+they are only counted in `partial`. A run converted to another format has a file per format, every run only counts
+once however many files it has.
+"""
+
+CUBE = 'sweep_cube.npz'
+
+AXES = ('strategy', 'iterations', 'clients', 'free_rider_ratio', 'peer_size', 'max_up', 'max_down')
+METRICS = SUMMARY_COLUMNS
+
+# what tells runs apart, the same as the entries of parse_data_folder, plus the replicate
+IDENTITY = ('strategy', 'iterations', 'max_up', 'max_down', 'starting_good_clients', 'starting_bad_clients',
+            'peer_size')
+
+
+def run_identity(metadata: Dict[str, Any]) -> Tuple[Any, ...]:
+    return tuple(metadata[k] for k in IDENTITY) + (metadata.get('replicate', 0),)
+
+
+def axis_value(metadata: Dict[str, Any], axis: str) -> Any:
+    clients = metadata['starting_good_clients'] + metadata['starting_bad_clients']
+    if axis == 'clients':
+        return clients
+    if axis == 'free_rider_ratio':
+        return round(metadata['starting_bad_clients'] / clients, 6)
+    return metadata[axis]
+
+
+class SweepCube:
+    def __init__(self, labels: Dict[str, np.ndarray], totals: np.ndarray, runs: np.ndarray, partial: np.ndarray,
+                 key: str = ''):
+        self.labels = labels
+        # shape (*axes, metric)
+        self.totals = totals
+        # shape (*axes)
+        self.runs = runs
+        # shape (*axes), runs that did not finish
+        self.partial = partial
+        # of the runs the cube was built from, see build_cube
+        self.key = key
+
+    @classmethod
+    def from_runs(cls, runs: Sequence[Tuple[Dict[str, Any], Dict[str, Any]]],
+                  partial: Sequence[Dict[str, Any]] = (), key: str = '') -> 'SweepCube':
+        """ Cube of (metadata, summary) pairs of finished runs and the metadata of unfinished ones """
+        everything = [meta for meta, _ in runs] + list(partial)
+        labels = {k: np.array(sorted({axis_value(meta, k) for meta in everything})) for k in AXES}
+        positions = {k: {x: i for i, x in enumerate(v.tolist())} for k, v in labels.items()}
+        shape = tuple(len(labels[k]) for k in AXES)
+
+        def cell(meta: Dict[str, Any]) -> Tuple[int, ...]:
+            return tuple(positions[k][axis_value(meta, k)] for k in AXES)
+
+        totals = np.zeros(shape + (len(METRICS),))
+        counts = np.zeros(shape, dtype=np.int64)
+        for meta, summary in runs:
+            totals[cell(meta)] += [summary[k] for k in METRICS]
+            counts[cell(meta)] += 1
+        partial_counts = np.zeros(shape, dtype=np.int64)
+        for meta in partial:
+            partial_counts[cell(meta)] += 1
+        return cls(labels, totals, counts, partial_counts, key)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['SweepCube']:
+        """ None for a cube saved before it had partial counts and a key """
+        with np.load(path) as f:
+            if 'key' not in f.files:
+                return None
+            return cls({k: f[f'axis_{k}'] for k in AXES}, f['totals'], f['runs'], f['partial'], str(f['key']))
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            np.savez(f, totals=self.totals, runs=self.runs, partial=self.partial, key=np.array(self.key),
+                     **{f'axis_{k}': v for k, v in self.labels.items()})
+
+    def index(self, axis: str, value: str) -> int:
+        """ Position of a label on an axis, given as it is printed """
+        labels = [str(x) for x in self.labels[axis].tolist()]
+        if value not in labels:
+            raise ValueError(f"{axis} has no {value}, it has {', '.join(labels)}")
+        return labels.index(value)
+
+    def view(self, metric: str, keep: Sequence[str], fixed: Optional[Dict[str, str]] = None) -> np.ndarray:
+        """
+        Mean of a metric with one dimension per axis in keep, in that order. Axes in fixed are taken at that
+        label, all the others are averaged over.
+        """
+        fixed = fixed or {}
+        unknown = (set(keep) | set(fixed)) - set(AXES)
+        if unknown:
+            raise ValueError(f"unknown axes {', '.join(sorted(unknown))}, the axes are {', '.join(AXES)}")
+        selection = tuple(self.index(k, fixed[k]) if k in fixed else slice(None) for k in AXES)
+        totals = self.totals[selection][..., METRICS.index(metric)]
+        runs = self.runs[selection]
+        remaining = [k for k in AXES if k not in fixed]
+        averaged = tuple(i for i, k in enumerate(remaining) if k not in keep)
+        totals, runs = totals.sum(axis=averaged), runs.sum(axis=averaged)
+        order = [k for k in remaining if k in keep]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = totals / runs
+        return mean.transpose([order.index(k) for k in keep])
+
+
+def result_folders(results_folder: Path) -> List[Path]:
+    """ The results folder and its sub folders, but not the .cols results in them """
+    return [results_folder] + sorted(x for x in results_folder.iterdir()
+                                     if x.is_dir() and x.suffix not in RESULT_SUFFIXES)
+
+
+def build_cube(results_folder: str, processes: Optional[int] = None) -> SweepCube:
+    """ The cube of every run under results_folder, rebuilt only when a run was added, changed or removed """
+    folder = Path(results_folder)
+    # by run identity, a run that finished in any of its files counts as finished
+    runs: Dict[Tuple[Any, ...], Tuple[Dict[str, Any], Dict[str, Any]]] = {}
+    partial: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    indexed = []
+    for x in result_folders(folder):
+        with SummaryIndex(str(x)) as index:
+            # runs written since anyone last looked at the folder get into the index first
+            index.refresh(processes)
+            for name, meta, summary in index.runs():
+                runs.setdefault(run_identity(meta), (meta, summary))
+                indexed.append((x.name, name, meta, summary))
+            for name, meta in index.partial_runs():
+                partial.setdefault(run_identity(meta), meta)
+                indexed.append((x.name, name, meta, None))
+    # what the cube is built from, whatever the mtimes of the files involved say
+    key = sha1(dumps(indexed, sort_keys=True).encode()).hexdigest()
+    path = folder / CUBE
+    if path.exists():
+        cube = SweepCube.load(str(path))
+        if cube is not None and cube.key == key:
+            return cube
+    cube = SweepCube.from_runs(list(runs.values()), [v for k, v in partial.items() if k not in runs], key)
+    cube.save(str(path))
+    return cube
@@ -0,0 +1,21 @@
+from hashlib import sha1
+from json import dumps
+from random import Random
+from typing import Type
+
+from client import Client
+from extra_types import Points, no_points
+from model import Model
+from strategies import Strategy
+from swarm import Swarm
+
+
+def run_digest(strategy: Type[Strategy], seed: int, good: int, bad: int, peer_size: int, up: int, down: int,
+               iterations: int) -> str:
+    """ sha1 of every client's state in every iteration of a seeded run, with the invariant checks on """
+    swarm = Swarm(rng=Random(seed))
+    for i in range(good + bad):
+        swarm.join(Client(strat=strategy, up=Points(up) if i < good else no_points, down=Points(down),
+                          peer_size=peer_size, swarm=swarm, iterations=iterations))
+    states = [[x.to_json(i) for x in results] for i, results in enumerate(Model.run(swarm, iterations))]
+    return sha1(dumps(states, sort_keys=True).encode()).hexdigest()
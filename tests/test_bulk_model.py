@@ -0,0 +1,66 @@
+import numpy as np
+
+from bulk_model import fair_share, random_rank, spread
+
+
+def test_fair_share_grants_everything_when_supply_covers_it():
+    rng = np.random.default_rng(0)
+    requests = np.array([3, 0, 5, 2])
+    for supply in (10, 11, 100):
+        assert fair_share(requests, supply, rng).tolist() == [3, 0, 5, 2]
+
+
+def test_fair_share_is_max_min_fair():
+    rng = np.random.default_rng(1)
+    # a level of 3 uses 1 + 2 + 3 * 3 = 12, the 2 left go to two of the three larger requests
+    grants = fair_share(np.array([1, 2, 7, 4, 3]), 14, rng)
+    assert grants[:2].tolist() == [1, 2]
+    assert sorted(grants[2:].tolist()) == [3, 4, 4]
+    # nothing to hand out
+    assert fair_share(np.array([4, 1]), 0, rng).tolist() == [0, 0]
+
+
+def test_fair_share_never_exceeds_requests_or_supply():
+    rng = np.random.default_rng(2)
+    for _ in range(500):
+        requests = rng.integers(0, 20, size=rng.integers(1, 12))
+        supply = int(rng.integers(0, 2 * requests.sum() + 2))
+        grants = fair_share(requests, supply, rng)
+        assert (grants >= 0).all() and (grants <= requests).all()
+        assert grants.sum() == min(supply, requests.sum())
+        # max-min fair: a request that got less than it asked for got at least as much as anybody else, less one
+        short = grants < requests
+        if short.any():
+            assert grants[short].min() >= grants.max() - 1
+
+
+def test_spread_conserves_totals_and_splits_evenly():
+    rng = np.random.default_rng(3)
+    for _ in range(500):
+        n = int(rng.integers(1, 8))
+        groups = rng.permutation(np.r_[np.arange(n), rng.integers(0, n, size=rng.integers(0, 20))])
+        totals = rng.integers(0, 30, size=n)
+        shares = spread(totals, groups, rng)
+        assert (shares >= 0).all()
+        assert np.bincount(groups, weights=shares, minlength=n).tolist() == totals.tolist()
+        for g in range(n):
+            members = shares[groups == g]
+            assert members.max() - members.min() <= 1
+
+
+def test_random_rank_is_a_permutation_within_every_group():
+    rng = np.random.default_rng(4)
+    groups = np.array([2, 0, 2, 1, 2, 0, 2])
+    rank = random_rank(groups, rng)
+    for g in range(3):
+        assert sorted(rank[groups == g].tolist()) == list(range((groups == g).sum()))
+    assert random_rank(np.array([], dtype=np.int64), rng).size == 0
+
+
+def test_same_seed_same_allocation():
+    requests = np.array([5, 9, 2, 8, 8])
+    groups = np.array([0, 1, 1, 0, 2, 2, 1])
+    totals = np.array([7, 10, 3])
+    a, b = np.random.default_rng(5), np.random.default_rng(5)
+    assert fair_share(requests, 20, a).tolist() == fair_share(requests, 20, b).tolist()
+    assert spread(totals, groups, a).tolist() == spread(totals, groups, b).tolist()
@@ -0,0 +1,126 @@
+from random import Random
+
+import pytest
+
+from contribution_history import ContributionHistory
+from strategies import OptimisticUnchoking
+from tests.seeded_runs import run_digest
+
+WINDOW = 4
+
+
+class Reference:
+    """ The unbounded per-peer lists ContributionHistory replaced """
+
+    def __init__(self):
+        self.values = {}
+        self.added = {}
+
+    def add(self, peer, iteration):
+        self.values[peer] = {}
+        self.added[peer] = iteration
+
+    def record(self, peer, iteration, amount):
+        self.values[peer][iteration] = amount
+
+    def get(self, peer, iteration):
+        return self.values[peer].get(iteration, 0)
+
+    def since_added(self, peer):
+        return sum(v for i, v in self.values[peer].items() if i >= self.added[peer])
+
+    def nonzero(self, peer):
+        return sum(1 for v in self.values[peer].values() if v)
+
+
+def test_matches_the_unbounded_history_across_wrap_around_and_restarts():
+    for seed in range(20):
+        rng = Random(seed)
+        history, reference = ContributionHistory(WINDOW), Reference()
+        for iteration in range(40):
+            for peer in 'abc':
+                if peer not in history:
+                    if rng.random() < .5:
+                        history.add(peer, iteration)
+                        reference.add(peer, iteration)
+                    continue
+                if rng.random() < .2:
+                    history.restart(peer, iteration)
+                    reference.added[peer] = iteration
+                # some iterations are skipped, some recorded twice
+                for _ in range(rng.choice((0, 1, 1, 2))):
+                    amount = rng.choice((0, 0, 1, 3, 7))
+                    history.record(peer, iteration, amount)
+                    reference.record(peer, iteration, amount)
+                if rng.random() < .2:
+                    history.restart(peer, iteration)
+                    reference.added[peer] = iteration
+                assert history.added(peer) == reference.added[peer]
+                assert history.since_added(peer) == reference.since_added(peer)
+                assert history.nonzero(peer) == reference.nonzero(peer)
+                assert history.recent(peer, iteration - WINDOW + 1, iteration + 1) == \
+                    [reference.get(peer, i) for i in range(max(iteration - WINDOW + 1, 0), iteration + 1)]
+
+
+def test_get_wraps_around_the_window():
+    history = ContributionHistory(WINDOW)
+    history.add('a', 0)
+    for iteration in range(10):
+        history.record('a', iteration, iteration + 1)
+    assert [history.get('a', i) for i in range(6, 10)] == [7, 8, 9, 10]
+    assert history.recent('a', 6, 12) == [7, 8, 9, 10, 0, 0]
+    with pytest.raises(IndexError):
+        history.get('a', 5)
+
+
+def test_skipped_iterations_read_as_nothing():
+    history = ContributionHistory(WINDOW)
+    history.add('a', 0)
+    history.record('a', 0, 5)
+    history.record('a', 1, 6)
+    history.record('a', 4, 2)
+    assert history.recent('a', 1, 5) == [6, 0, 0, 2]
+    # a jump past the whole window clears it
+    history.record('a', 20, 1)
+    assert history.recent('a', 17, 21) == [0, 0, 0, 1]
+    assert history.since_added('a') == 14
+    assert history.nonzero('a') == 4
+
+
+def test_restart_counts_from_the_new_iteration():
+    history = ContributionHistory(WINDOW)
+    history.add('a', 0)
+    for iteration, amount in enumerate((1, 2, 3, 4, 5)):
+        history.record('a', iteration, amount)
+    assert history.since_added('a') == 15
+    history.restart('a', 3)
+    assert history.added('a') == 3
+    assert history.since_added('a') == 9
+    history.record('a', 4, 1)
+    assert history.since_added('a') == 5
+    history.restart('a', 6)
+    assert history.since_added('a') == 0
+
+
+def test_old_iterations_can_not_be_recorded():
+    history = ContributionHistory(WINDOW)
+    history.add('a', 0)
+    history.record('a', 3, 1)
+    history.record('a', 3, 2)
+    with pytest.raises(ValueError):
+        history.record('a', 2, 1)
+    with pytest.raises(ValueError):
+        ContributionHistory(0)
+
+
+# sha1s of run_digest as produced before contributions went into ContributionHistory
+OPTIMISTIC_UNCHOKING_RUNS = [
+    ((0, 30, 10, 5, 30, 10, 30), 'de90c3e7f4d84597c1ff01f520fdbf3692cbe834'),
+    ((1, 30, 10, 5, 30, 10, 30), '91a8a1b85220e4f2d5657a6b391b26127fd32a68'),
+    ((3, 20, 5, 3, 10, 10, 30), '55bbef049612c579f2ac77e61db2dc0f5f60d2ce'),
+]
+
+
+@pytest.mark.parametrize('run, digest', OPTIMISTIC_UNCHOKING_RUNS)
+def test_optimistic_unchoking_runs_are_unchanged(run, digest):
+    assert run_digest(OptimisticUnchoking, *run) == digest
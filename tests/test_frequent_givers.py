@@ -0,0 +1,78 @@
+from random import Random
+
+import pytest
+
+from contribution_history import FrequentGivers
+from strategies import DemeritChoking
+from tests.seeded_runs import run_digest
+
+WINDOW = 6
+TIMES = 4
+
+
+def recount(gave, iteration):
+    """ Peers that gave in at least TIMES of the WINDOW iterations before iteration """
+    counts = {}
+    for i in range(iteration - WINDOW, iteration):
+        for peer in gave.get(i, ()):
+            counts[peer] = counts.get(peer, 0) + 1
+    return {peer for peer, n in counts.items() if n >= TIMES}
+
+
+def test_window_slides_one_iteration_at_a_time():
+    givers = FrequentGivers(WINDOW, TIMES)
+    seen = []
+    # a gives in iterations 0-3, b in 2, 4, 5 and 7
+    for iteration in range(12):
+        seen.append(set(givers.at(iteration)))
+        if iteration < 4:
+            givers.record('a', iteration, 1)
+        if iteration in (2, 4, 5, 7):
+            givers.record('b', iteration, 2)
+    # a counts once 0-3 are in the window, and leaves when 0 drops out at 7
+    assert [('a' in x) for x in seen] == [False] * 4 + [True] * 3 + [False] * 5
+    # b needs 2, 4, 5 and 7 together, [2, 8) holds all of them and [3, 9) doesn't
+    assert [('b' in x) for x in seen] == [False] * 8 + [True] + [False] * 3
+
+
+def test_matches_a_recount_of_the_window():
+    for seed in range(20):
+        rng = Random(seed)
+        givers = FrequentGivers(WINDOW, TIMES)
+        gave = {}
+        for iteration in range(60):
+            assert givers.at(iteration) == recount(gave, iteration)
+            for peer in 'abcde':
+                # a contribution can be recorded again, or taken back with a zero
+                for _ in range(rng.choice((0, 1, 1, 2))):
+                    amount = rng.choice((0, 1, 1, 2))
+                    givers.record(peer, iteration, amount)
+                    if amount:
+                        gave.setdefault(iteration, set()).add(peer)
+                    else:
+                        gave.get(iteration, set()).discard(peer)
+
+
+def test_recording_ahead_slides_the_window_first():
+    givers = FrequentGivers(WINDOW, TIMES)
+    for iteration in (0, 1, 2, 3):
+        givers.record('a', iteration, 1)
+    # jumping ahead drops the iterations that left the window
+    givers.record('a', 9, 1)
+    assert givers.at(9) == set()
+    assert givers.at(10) == set()
+    with pytest.raises(ValueError):
+        givers.record('a', 5, 1)
+
+
+# sha1s of run_digest as produced before the frequent givers were indexed
+DEMERIT_CHOKING_RUNS = [
+    ((0, 20, 5, 3, 10, 10, 30), 'dc57d4cb1d7c11bb3b7c3b0bab890780d0b8663c'),
+    ((1, 20, 5, 3, 10, 10, 30), '8f69bc53794d7f1f4686d970e6aff214f1c334e5'),
+    ((2, 30, 10, 5, 30, 10, 30), '5108c992ab0d673b8a50229f6c3b3a6adce03677'),
+]
+
+
+@pytest.mark.parametrize('run, digest', DEMERIT_CHOKING_RUNS)
+def test_demerit_choking_runs_are_unchanged(run, digest):
+    assert run_digest(DemeritChoking, *run) == digest
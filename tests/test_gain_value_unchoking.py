@@ -0,0 +1,19 @@
+import pytest
+
+from strategies import GainValueUnchoking
+from tests.seeded_runs import run_digest
+
+# sha1s of run_digest as produced before the statistics became running aggregates
+GAIN_VALUE_UNCHOKING_RUNS = [
+    ((0, 30, 10, 5, 30, 10, 30), 'f6d275176d4ce9d2753ad74bcf4cae96b14ea260'),
+    ((1, 20, 5, 3, 10, 10, 30), 'da9280a589983d4d3c5eec7a158f3dfabbc6ae6c'),
+    ((2, 30, 10, 5, 30, 10, 30), '2b42a9faa8834974a967587b6ddc41ab02cc0428'),
+    ((3, 20, 5, 3, 10, 10, 30), 'f4066c71ed3ad0186ef7a9431f07590ae6ca37f1'),
+]
+
+
+# peers that were never unchoked divide by zero, that is part of what is pinned
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('run, digest', GAIN_VALUE_UNCHOKING_RUNS)
+def test_gain_value_unchoking_runs_are_unchanged(run, digest):
+    assert run_digest(GainValueUnchoking, *run) == digest
@@ -0,0 +1,100 @@
+from random import Random
+
+from peer_graph import PeerGraph
+
+NODES = 12
+
+
+def graph():
+    g = PeerGraph()
+    # the graph only hands clients back, any object can stand in for one
+    for i in range(NODES):
+        assert g.add_node(f"client{i}") == i
+    return g
+
+
+def check_against_recount(g, rows):
+    """ rows is what the graph should hold, {a: {b: points}} """
+    for b in range(NODES):
+        expected = sorted(a for a in range(NODES) if b in rows[a])
+        assert g.inbound(b) == [g.client(a) for a in expected]
+        assert g.in_degree(b) == len(expected)
+    for a in range(NODES):
+        assert g.neighbors(a) == [g.client(b) for b in rows[a]]
+        assert g.degree(a) == len(rows[a])
+        assert g.contributions(a) == {g.client(b): v for b, v in rows[a].items()}
+        assert g.total_received(a) == sum(rows[a].values())
+
+
+def random_edit(g, rows, rng):
+    """ One random change to g, mirrored into rows, returns the slots it touched """
+    a, b = rng.sample(range(NODES), 2)
+    kind = rng.randrange(5)
+    if kind == 0 and b not in rows[a] and a not in rows[b]:
+        g.connect(a, b)
+        rows[a][b] = rows[b][a] = 0
+        return {a, b}
+    if kind == 1 and b in rows[a] and a in rows[b]:
+        g.disconnect(a, b)
+        del rows[a][b], rows[b][a]
+        return {a, b}
+    if kind == 2:
+        if b in rows[a]:
+            g.remove_edge(a, b)
+            del rows[a][b]
+        else:
+            g.add_edge(a, b)
+            rows[a][b] = 0
+        return {a, b}
+    if kind == 3:
+        peers = rng.sample([x for x in range(NODES) if x != a], rng.randrange(5))
+        touched = {a} | (rows[a].keys() ^ set(peers))
+        g.set_neighbors(a, peers)
+        rows[a] = dict.fromkeys(peers, 0)
+        return touched
+    if rows[a]:
+        b = rng.choice(list(rows[a]))
+        amount = rng.randrange(1, 10)
+        g.add_contribution(a, b, amount)
+        rows[a][b] += amount
+    return set()
+
+
+def test_indexes_match_a_recount_after_random_edits():
+    for seed in range(20):
+        rng = Random(seed)
+        g = graph()
+        rows = {a: {} for a in range(NODES)}
+        for _ in range(300):
+            random_edit(g, rows, rng)
+            check_against_recount(g, rows)
+
+
+def test_take_touched_returns_the_changed_slots_and_resets():
+    rng = Random(99)
+    g = graph()
+    rows = {a: {} for a in range(NODES)}
+    assert g.take_touched() == set()
+    for _ in range(200):
+        touched = set()
+        for _ in range(rng.randrange(4)):
+            touched |= random_edit(g, rows, rng)
+        assert g.take_touched() == touched
+        assert g.take_touched() == set()
+
+
+def test_removing_an_edge_takes_its_contributions_out_of_the_total():
+    g = graph()
+    g.connect(0, 1)
+    g.add_edge(0, 2)
+    g.add_contribution(0, 1, 5)
+    g.add_contribution(0, 2, 3)
+    g.add_contribution(0, 1, 1)
+    assert g.total_received(0) == 9
+    g.remove_edge(0, 1)
+    assert g.total_received(0) == 3
+    assert g.inbound(1) == []
+    assert g.inbound(0) == [g.client(1)]
+    g.set_neighbors(0, [2, 3])
+    assert g.total_received(0) == 0
+    assert g.contributions(0) == {g.client(2): 0, g.client(3): 0}
@@ -0,0 +1,86 @@
+import pytest
+
+from results_io import ResultWriter, finished, stream_results, to_columnar, to_stream
+
+
+def entries(iteration):
+    return [{'iteration': iteration, 'id': k, 'amount_acquired': 1, 'amount_remaining': 0, 'willing_to_give': 1,
+             'free_rider': False, 'peers': [1 - k]} for k in range(2)]
+
+
+def write_run(path, iterations, finish=True):
+    writer = ResultWriter(str(path), {'iterations': iterations})
+    for i in range(iterations):
+        writer.write_entries(i, entries(i))
+    if finish:
+        writer.close()
+    else:
+        # what a run killed between two iterations leaves behind
+        writer._file.close()
+
+
+def test_a_finished_run_reads_back_with_its_footer(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_run(path, 3)
+    metadata, iterations = stream_results(str(path))
+    assert [i for i, _ in iterations] == [0, 1, 2]
+    assert metadata['completed_iterations'] == 3
+
+
+def test_a_line_cut_short_ends_the_stream(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_run(path, 5, finish=False)
+    with open(path, 'rb+') as f:
+        f.truncate(path.stat().st_size - 10)
+    metadata, iterations = stream_results(str(path))
+    read = list(iterations)
+    assert [i for i, _ in read] == [0, 1, 2, 3]
+    assert read[-1][1] == entries(3)
+    assert 'completed_iterations' not in metadata
+
+
+def test_resume_drops_what_comes_after_the_kept_iterations(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_run(path, 4, finish=False)
+    with open(path, 'ab') as f:
+        f.write(b'{"iteration": 4, "da')
+    with ResultWriter.resume(str(path), 2) as writer:
+        writer.write_entries(2, entries(2))
+    metadata, iterations = stream_results(str(path))
+    assert [i for i, _ in iterations] == [0, 1, 2]
+    assert metadata['completed_iterations'] == 3
+
+
+def test_resume_needs_the_iterations_it_keeps(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_run(path, 2, finish=False)
+    with open(path, 'ab') as f:
+        f.write(b'{"iteration": 2, "da')
+    with pytest.raises(ValueError):
+        ResultWriter.resume(str(path), 3)
+
+
+def test_conversions_keep_a_partial_run_partial(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_run(path, 3, finish=False)
+    columnar = to_columnar(str(path))
+    metadata, _ = stream_results(columnar)
+    assert not finished(columnar, metadata)
+    path.unlink()
+    stream = to_stream(columnar)
+    metadata, iterations = stream_results(stream)
+    assert [i for i, _ in iterations] == [0, 1, 2]
+    assert not finished(stream, metadata)
+
+
+def test_conversions_keep_a_finished_run_finished(tmp_path):
+    path = tmp_path / 'run.jsonl'
+    write_run(path, 3)
+    columnar = to_columnar(str(path))
+    metadata, _ = stream_results(columnar)
+    assert finished(columnar, metadata) and metadata['completed_iterations'] == 3
+    path.unlink()
+    stream = to_stream(columnar)
+    metadata, iterations = stream_results(stream)
+    assert [i for i, _ in iterations] == [0, 1, 2]
+    assert finished(stream, metadata) and metadata['completed_iterations'] == 3
@@ -0,0 +1,61 @@
+import os
+
+from results_io import ResultWriter
+from summary_index import SummaryIndex
+
+
+def metadata(peer_size):
+    return {'strategy': 'NoStrategy', 'iterations': 6, 'max_up': 10, 'max_down': 10, 'starting_good_clients': 1,
+            'starting_bad_clients': 1, 'peer_size': peer_size}
+
+
+def entries(iteration, amount):
+    return [{'iteration': iteration, 'id': k, 'amount_acquired': amount, 'amount_remaining': 0,
+             'willing_to_give': 1, 'free_rider': k == 1, 'peers': [1 - k]} for k in range(2)]
+
+
+def write_run(path, peer_size, iterations, finish=True):
+    writer = ResultWriter(str(path), metadata(peer_size))
+    for i in range(iterations):
+        writer.write_entries(i, entries(i, 1 if i < 4 else 0))
+    if finish:
+        writer.close()
+    else:
+        writer._file.close()
+
+
+def test_runs_without_a_footer_are_indexed_as_partial(tmp_path):
+    write_run(tmp_path / 'done.jsonl', 1, 6)
+    write_run(tmp_path / 'crashed.jsonl', 2, 3, finish=False)
+    # killed half way through writing the next line
+    with open(tmp_path / 'crashed.jsonl', 'a') as f:
+        f.write('{"iteration": 3, "data": [{"amou')
+    with SummaryIndex(str(tmp_path)) as index:
+        assert index.refresh(1) == 2
+        assert [(name, summary) for name, _, summary in index.runs()] == \
+            [('done.jsonl', {'end': 5, 'free_riders': .5})]
+        assert [name for name, _ in index.partial_runs()] == ['crashed.jsonl']
+
+
+def test_a_resumed_run_becomes_complete(tmp_path):
+    write_run(tmp_path / 'run.jsonl', 1, 3, finish=False)
+    with SummaryIndex(str(tmp_path)) as index:
+        index.refresh(1)
+        assert list(index.runs()) == []
+        write_run(tmp_path / 'run.jsonl', 1, 6)
+        assert index.refresh(1) == 1
+        assert [name for name, _, _ in index.runs()] == ['run.jsonl']
+        assert list(index.partial_runs()) == []
+
+
+def test_rows_of_files_that_became_unreadable_or_went_away_are_dropped(tmp_path):
+    write_run(tmp_path / 'a.jsonl', 1, 6)
+    write_run(tmp_path / 'b.jsonl', 2, 6)
+    with SummaryIndex(str(tmp_path)) as index:
+        index.refresh(1)
+        with open(tmp_path / 'a.jsonl', 'w') as f:
+            f.write('{"metad')
+        os.remove(tmp_path / 'b.jsonl')
+        assert index.refresh(1) == 2
+        assert list(index.runs()) == []
+        assert list(index.partial_runs()) == []
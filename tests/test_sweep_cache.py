@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+import generations
+from bulk_model import BulkModel
+from extra_types import Points
+from generations import RunOptions, SEED, events_file, output_file, run_cached, run_task
+from model import CheckLevel
+from results_io import stream_results
+from strategies import NoStrategy, DropZeros
+from sweep_cache import Manifest, task_key, task_seed, FAILED, IN_FLIGHT
+
+TASK = (NoStrategy, 6, 4, 1, 2, Points(10), Points(10))
+
+
+def key(options, task=TASK, replicate=0):
+    return task_key(task, task_seed(task, SEED, replicate), options.cache_fields())
+
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(generations, 'RESULTS_FOLDER', str(tmp_path))
+    return Manifest(str(tmp_path))
+
+
+def run(manifest, options, replicate=0):
+    assert run_cached((TASK, replicate, key(options, replicate=replicate)), options, manifest) is not None
+
+
+@pytest.mark.parametrize('options', [
+    RunOptions(model=BulkModel),
+    RunOptions(columnar=True),
+    RunOptions(stop_on=('zero',)),
+    RunOptions(stable_for=3),
+])
+def test_options_that_change_the_output_change_the_key(options):
+    assert key(options) != key(RunOptions())
+
+
+def test_options_that_dont_change_the_output_keep_the_key():
+    options = RunOptions(check_level=CheckLevel.OFF, profile=False, checkpoint_every=5)
+    assert key(options) == key(RunOptions())
+
+
+def test_tasks_and_replicates_have_their_own_keys():
+    other = (DropZeros,) + TASK[1:]
+    assert len({key(RunOptions()), key(RunOptions(), task=other), key(RunOptions(), replicate=1)}) == 3
+
+
+def test_a_completed_task_is_done(manifest):
+    options = RunOptions(profile=False)
+    run(manifest, options)
+    assert manifest.is_done(manifest.load(), key(options))
+    assert not manifest.is_done(manifest.load(), key(options, replicate=1))
+
+
+def test_a_task_whose_output_is_gone_is_not_done(manifest):
+    options = RunOptions(profile=False)
+    run(manifest, options)
+    os.remove(output_file(TASK, options))
+    assert not manifest.is_done(manifest.load(), key(options))
+
+
+def test_a_task_whose_output_another_sweep_overwrote_is_not_done(manifest):
+    default, no_stop = RunOptions(stop_on=('zero',), profile=False), RunOptions(profile=False)
+    assert output_file(TASK, default) == output_file(TASK, no_stop)
+    run(manifest, default)
+    run(manifest, no_stop)
+    assert not manifest.is_done(manifest.load(), key(default))
+    assert manifest.is_done(manifest.load(), key(no_stop))
+    run(manifest, default)
+    assert manifest.is_done(manifest.load(), key(default))
+    assert not manifest.is_done(manifest.load(), key(no_stop))
+
+
+def test_failed_and_unfinished_tasks_are_not_done(manifest):
+    options = RunOptions(profile=False)
+    run(manifest, options)
+    manifest.record(key(options), IN_FLIGHT)
+    assert not manifest.is_done(manifest.load(), key(options))
+    manifest.record(key(options), FAILED, error='boom')
+    assert not manifest.is_done(manifest.load(), key(options))
+
+
+def test_a_sweep_asking_for_events_reruns_tasks_without_them(manifest):
+    options, traced = RunOptions(profile=False), RunOptions(profile=False, record_events=True)
+    assert key(options) == key(traced)
+    run(manifest, options)
+    assert not manifest.is_done(manifest.load(), key(traced), events=True)
+    run(manifest, traced)
+    assert manifest.is_done(manifest.load(), key(traced), events=True)
+    # the trace is extra, a sweep without --events still takes the run
+    assert manifest.is_done(manifest.load(), key(options))
+    os.remove(events_file(output_file(TASK, traced)))
+    assert not manifest.is_done(manifest.load(), key(traced), events=True)
+
+
+@pytest.fixture
+def crash_at_4(monkeypatch):
+    """ While crashing is set, runs die right after their snapshot of iteration 4 is on disk """
+    checkpoint = generations.Checkpointer.__call__
+    crashing = {'on': True}
+
+    def crash(self, snapshot):
+        checkpoint(self, snapshot)
+        if crashing['on'] and snapshot.iteration == 4:
+            raise RuntimeError("killed")
+    monkeypatch.setattr(generations.Checkpointer, '__call__', crash)
+    return crashing
+
+
+def iterations_of(path):
+    metadata, iterations = stream_results(path)
+    return list(iterations), metadata
+
+
+def test_a_run_resumes_from_its_snapshot(manifest, crash_at_4):
+    options = RunOptions(profile=False, checkpoint_every=2)
+    with pytest.raises(RuntimeError):
+        run_task(TASK, options)
+    crash_at_4['on'] = False
+    run_task(TASK, options)
+    resumed, metadata = iterations_of(output_file(TASK, options))
+    assert metadata['resumed_from'] == 4
+    run_task(TASK, RunOptions(profile=False))
+    assert iterations_of(output_file(TASK, options))[0] == resumed
+
+
+def test_a_snapshot_taken_with_other_options_is_not_resumed(manifest, crash_at_4):
+    bulk, exact = RunOptions(model=BulkModel, profile=False, checkpoint_every=2), \
+        RunOptions(profile=False, checkpoint_every=2)
+    with pytest.raises(RuntimeError):
+        run_task(TASK, bulk)
+    crash_at_4['on'] = False
+    run_task(TASK, exact)
+    resumed, metadata = iterations_of(output_file(TASK, exact))
+    assert 'resumed_from' not in metadata
+    assert metadata['cache_key'] == key(exact)
+    run_task(TASK, RunOptions(profile=False))
+    assert iterations_of(output_file(TASK, exact))[0] == resumed
@@ -0,0 +1,54 @@
+import numpy as np
+
+from results_io import ResultWriter, to_columnar
+from sweep_cube import build_cube
+
+
+def write_run(path, peer_size, ends_at, finish=True, replicate=0):
+    writer = ResultWriter(str(path), {'strategy': 'NoStrategy', 'iterations': 8, 'max_up': 10, 'max_down': 10,
+                                      'starting_good_clients': 3, 'starting_bad_clients': 1,
+                                      'peer_size': peer_size, 'replicate': replicate})
+    for i in range(8 if finish else 3):
+        writer.write_entries(i, [{'iteration': i, 'id': k, 'amount_acquired': int(i < ends_at),
+                                  'amount_remaining': 0, 'willing_to_give': 1, 'free_rider': k == 3,
+                                  'peers': []} for k in range(4)])
+    if finish:
+        writer.close()
+    else:
+        writer._file.close()
+
+
+def test_partial_runs_are_counted_but_not_averaged(tmp_path):
+    write_run(tmp_path / 'a.jsonl', 2, 4)
+    write_run(tmp_path / 'b.jsonl', 2, 6, replicate=1)
+    write_run(tmp_path / 'c.jsonl', 2, 8, finish=False, replicate=2)
+    cube = build_cube(str(tmp_path), 1)
+    assert cube.runs.sum() == 2 and cube.partial.sum() == 1
+    assert cube.view('end', ('peer_size',)).tolist() == [6.]
+
+
+def test_a_converted_run_counts_once(tmp_path):
+    write_run(tmp_path / 'a.jsonl', 2, 4)
+    assert build_cube(str(tmp_path), 1).runs.sum() == 1
+    to_columnar(str(tmp_path / 'a.jsonl'))
+    cube = build_cube(str(tmp_path), 1)
+    assert cube.runs.sum() == 1
+    assert cube.view('end', ('peer_size',)).tolist() == [5.]
+
+
+def test_a_run_finished_in_one_of_its_files_is_not_partial(tmp_path):
+    write_run(tmp_path / 'a.jsonl', 2, 4, finish=False)
+    to_columnar(str(tmp_path / 'a.jsonl'))
+    write_run(tmp_path / 'a.jsonl', 2, 4)
+    cube = build_cube(str(tmp_path), 1)
+    assert (cube.runs.sum(), cube.partial.sum()) == (1, 0)
+
+
+def test_the_cube_follows_the_folder(tmp_path):
+    write_run(tmp_path / 'a.jsonl', 2, 4)
+    assert build_cube(str(tmp_path), 1).runs.sum() == 1
+    (tmp_path / 'NoStrategy').mkdir()
+    write_run(tmp_path / 'NoStrategy' / 'b.jsonl', 3, 6)
+    cube = build_cube(str(tmp_path), 1)
+    assert cube.labels['peer_size'].tolist() == [2, 3]
+    assert np.array_equal(cube.view('end', ('peer_size',)), [5., 7.])
@@ -0,0 +1,64 @@
+from random import Random
+
+from utils import IndexedSet
+
+
+def indexed(items):
+    s = IndexedSet()
+    for x in items:
+        s.add(x)
+    return s
+
+
+def test_add_and_discard_keep_membership():
+    s = indexed(range(10))
+    s.add(3)
+    for x in (0, 9, 4, 42):
+        s.discard(x)
+    assert len(s) == 7
+    assert set(s) == {1, 2, 3, 5, 6, 7, 8}
+    assert all(x in s for x in (1, 2, 3, 5, 6, 7, 8))
+    assert 4 not in s
+
+
+def test_sample_never_returns_excluded_members():
+    s = indexed(range(100))
+    exclude = set(range(0, 100, 3))
+    rng = Random(1)
+    for n in (1, 5, 20, 60):
+        picked = s.sample(n, exclude, rng)
+        assert len(picked) == n
+        assert len(set(picked)) == n
+        assert not set(picked) & exclude
+
+
+def test_sample_falls_back_to_a_scan_when_most_members_are_excluded():
+    s = indexed(range(1000))
+    allowed = {17, 512, 998}
+    picked = s.sample(2, set(range(1000)) - allowed, Random(2))
+    assert len(picked) == 2
+    assert set(picked) <= allowed
+
+
+def test_sample_at_least_as_many_as_eligible_returns_all_of_them():
+    s = indexed(range(10))
+    assert sorted(s.sample(10, set(), Random(3))) == list(range(10))
+    assert sorted(s.sample(50, set(), Random(3))) == list(range(10))
+    assert sorted(s.sample(8, {0, 1, 2, 3}, Random(3))) == [4, 5, 6, 7, 8, 9]
+    assert s.sample(5, set(range(10)), Random(3)) == []
+
+
+def test_sample_of_nothing():
+    assert indexed(range(10)).sample(0, set(), Random(4)) == []
+    assert IndexedSet().sample(3, set(), Random(4)) == []
+
+
+def test_sample_is_determined_by_the_rng():
+    s = indexed(range(200))
+    s.discard(50)
+    exclude = {1, 2, 3}
+    first = [s.sample(7, exclude, Random(5)) for _ in range(3)]
+    assert first[0] == first[1] == first[2]
+    rng_a, rng_b = Random(6), Random(6)
+    assert [s.sample(7, exclude, rng_a) for _ in range(5)] == [s.sample(7, exclude, rng_b) for _ in range(5)]
+    assert s.sample(7, exclude, Random(5)) != s.sample(7, exclude, Random(7))
@@ -1,4 +1,5 @@
-from typing import Iterator, TypeVar
+from random import Random
+from typing import Iterator, TypeVar, Generic, List, Dict, Container
 
 T = TypeVar('T')
 
@@ -7,3 +8,53 @@ def repeat_forever(it: Iterator[T]) -> Iterator[T]:
     items = list(it)
     while True:
         yield from items
+
+
+class IndexedSet(Generic[T]):
+    """ A set that can also pick random members in O(1), backed by a list plus a position map """
+
+    def __init__(self):
+        self._items: List[T] = []
+        self._positions: Dict[T, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: T) -> bool:
+        return item in self._positions
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self._items)
+
+    def add(self, item: T) -> None:
+        if item not in self._positions:
+            self._positions[item] = len(self._items)
+            self._items.append(item)
+
+    def discard(self, item: T) -> None:
+        pos = self._positions.pop(item, None)
+        if pos is None:
+            return
+        # move the last item into the hole so removal stays O(1)
+        last = self._items.pop()
+        if pos < len(self._items):
+            self._items[pos] = last
+            self._positions[last] = pos
+
+    def sample(self, n: int, exclude: Container[T], rng: Random) -> List[T]:
+        """ Up to n distinct random members that are not in exclude, drawn from rng """
+        if n <= 0 or not self._items:
+            return []
+        # Rejection sampling is O(n) as long as most members are eligible
+        picked: Dict[T, None] = {}
+        for _ in range(4 * n + 16):
+            item = self._items[rng.randrange(len(self._items))]
+            if item not in exclude:
+                picked[item] = None
+                if len(picked) == n:
+                    return list(picked)
+        # Most members are excluded, fall back to a full scan
+        candidates = [x for x in self._items if x not in exclude]
+        if len(candidates) <= n:
+            return candidates
+        return rng.sample(candidates, n)
@@ -0,0 +1,76 @@
+from random import Random
+from sys import argv
+from typing import Dict, List, Sequence, Type
+
+import numpy as np
+
+import strategies
+from bulk_model import BulkModel
+from extra_types import Points
+from generations import Task, SEED, build_swarm
+from model import Model, CheckLevel
+from swarm import Swarm
+from sweep_cache import task_seed
+
+"""
+Checks that BulkModel keeps the statistical behaviour of the exact, one unit at a time Model.
+
+Both models run the same configuration with the same seeds, and the distributions over seeds of a few per run
+summaries are compared with a two sample Kolmogorov-Smirnov test.
+"""
+
+METRICS = ('first_round', 'mean_acquired', 'end', 'free_riders')
+
+
+def summarize(model: Type[Model], t: Task, seeds: int) -> Dict[str, List[float]]:
+    """ The METRICS of one run per seed """
+    summaries: Dict[str, List[float]] = {k: [] for k in METRICS}
+    for replicate in range(seeds):
+        swarm = build_swarm(t, Swarm(rng=Random(task_seed(t, SEED, replicate))))
+        totals, free_riders = [], 0
+        for states in model.run(swarm, t[1], CheckLevel.OFF):
+            states = list(states)
+            totals.append(sum(x.amount_acquired for x in states))
+            free_riders = sum(x.free_rider for x in states)
+        zeros = [i for i, x in enumerate(totals) if x == 0]
+        summaries['first_round'].append(totals[0])
+        summaries['mean_acquired'].append(float(np.mean(totals)))
+        summaries['end'].append(zeros[0] + 1 if zeros else len(totals))
+        summaries['free_riders'].append(free_riders)
+    return summaries
+
+
+def ks_statistic(a: Sequence[float], b: Sequence[float]) -> float:
+    """ Largest gap between the empirical distributions of a and b """
+    a, b = np.sort(a), np.sort(b)
+    points = np.r_[a, b]
+    return float(np.max(np.abs(np.searchsorted(a, points, side='right') / len(a) -
+                               np.searchsorted(b, points, side='right') / len(b))))
+
+
+def validate(t: Task, seeds: int) -> bool:
+    """ Print how both models compare on every metric, returns whether none of them differs significantly """
+    exact = summarize(Model, t, seeds)
+    bulk = summarize(BulkModel, t, seeds)
+    # 5% critical value of the KS distance between two samples of `seeds` runs
+    critical = 1.36 * np.sqrt(2 / seeds)
+    same = True
+    for k in METRICS:
+        d = ks_statistic(exact[k], bulk[k])
+        same &= d <= critical
+        print(f"{k:14} exact {np.mean(exact[k]):10.2f} ± {np.std(exact[k]):8.2f}   "
+              f"bulk {np.mean(bulk[k]):10.2f} ± {np.std(bulk[k]):8.2f}   "
+              f"KS {d:.3f}{'' if d <= critical else ' > ' + format(critical, '.3f')}")
+    return same
+
+
+if __name__ == '__main__':
+    try:
+        strategy = getattr(strategies, argv[1])
+        iterations, good, bad, peer_size, max_up, max_down = (int(x) for x in argv[2:8])
+        num_seeds = int(argv[8]) if len(argv) > 8 else 20
+    except (IndexError, ValueError, AttributeError):
+        print(f"usage: {argv[0]} strategy iterations #good #bad peer_size max_up max_down [seeds]")
+    else:
+        ok = validate((strategy, iterations, good, bad, peer_size, Points(max_up), Points(max_down)), num_seeds)
+        print("no significant difference" if ok else "the distributions differ")
@@ -0,0 +1,81 @@
+from random import Random
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from client import Client
+from extra_types import Points
+from model import Model
+
+
+def willing_edges(all_agents: Sequence[Client]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Directed edges (receiver <- giver) as agent indices, only the ones the giver is willing to serve """
+    index = {agent: i for i, agent in enumerate(all_agents)}
+    receivers, givers = [], []
+    for i, agent in enumerate(all_agents):
+        for peer in agent.peers:
+            if peer.willing_to_give_to(agent):
+                receivers.append(i)
+                givers.append(index[peer])
+    return np.array(receivers, dtype=np.int64), np.array(givers, dtype=np.int64)
+
+
+def apply_transfers(all_agents: Sequence[Client], receivers: np.ndarray, givers: np.ndarray,
+                    received: np.ndarray) -> None:
+    """ Write the units that went over every edge back to the clients """
+    for e in np.flatnonzero(received):
+        all_agents[receivers[e]].give_content(all_agents[givers[e]], Points(int(received[e])))
+    spent = np.bincount(givers, weights=received, minlength=len(all_agents)).astype(np.int64)
+    for i in np.flatnonzero(spent):
+        all_agents[i].spend_upload(Points(int(spent[i])))
+
+
+class VectorizedModel(Model):
+    """
+    Same simulation as Model, but the content exchange runs on NumPy arrays.
+
+    Every round each agent that still wants content asks one random willing peer with upload left,
+    and every peer grants to as many of the agents asking it as it has upload for, picked at random.
+    That is the exchange rule Model.exchange follows, one unit per agent per pass from a random willing peer,
+    resolved for all agents at once. The order agents are served in and the random draws differ, so a run
+    behaves like Model's statistically but does not reproduce it at the same seed.
+    """
+
+    @staticmethod
+    def exchange(all_agents: Sequence[Client], rng: Random) -> None:
+        np_rng = np.random.default_rng(rng.getrandbits(64))
+        receivers, givers = willing_edges(all_agents)
+
+        n = len(all_agents)
+        up = np.array([x.upload_remaining for x in all_agents], dtype=np.int64)
+        down_left = np.array([x.max_down - x.amount_acquired for x in all_agents], dtype=np.int64)
+        received = np.zeros(len(receivers), dtype=np.int64)
+        active = down_left > 0
+
+        while True:
+            eligible = np.flatnonzero(active[receivers] & (up[givers] > 0))
+            # Agents without a single peer that can still give to them are done for this iteration
+            has_supply = np.zeros(n, dtype=bool)
+            has_supply[receivers[eligible]] = True
+            active &= has_supply
+            if not eligible.size:
+                break
+
+            # Every active agent asks one of its eligible peers, picked at random
+            order = eligible[np.lexsort((np_rng.random(eligible.size), receivers[eligible]))]
+            _, first = np.unique(receivers[order], return_index=True)
+            requests = order[first]
+
+            # Every peer grants to as many of the askers as it has upload for, picked at random
+            order = requests[np.lexsort((np_rng.random(requests.size), givers[requests]))]
+            asked = givers[order]
+            starts = np.flatnonzero(np.r_[True, asked[1:] != asked[:-1]])
+            rank = np.arange(asked.size) - np.repeat(starts, np.diff(np.r_[starts, asked.size]))
+            granted = order[rank < up[asked]]
+
+            up -= np.bincount(givers[granted], minlength=n)
+            down_left -= np.bincount(receivers[granted], minlength=n)
+            received[granted] += 1
+            active &= down_left > 0
+
+        apply_transfers(all_agents, receivers, givers, received)